@@ -1,11 +1,18 @@
 # accounts/admin.py
 from django.contrib import admin
+
+from task_manager.paginators import EstimatedCountPaginator
+
 from .models import CustomUser
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff', 'is_active')
-    search_fields = ('email', 'username')
+    # prefix search can use the unique indexes on email/username (also used by the Task owner autocomplete)
+    search_fields = ('^email', '^username')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
     readonly_fields = ('date_joined',)
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -11,6 +11,7 @@ from django.contrib.auth.decorators import login_required
 import base64
 import uuid
 from django.core.files.base import ContentFile
+from tasks import activity
 @login_required
 def profile_view(request):
     return render(request, 'profile.html', {})
@@ -46,6 +47,10 @@ def edit_profile_view(request):
             # If user didn't use crop and uploaded a file, Django handles request.FILES as usual.
             # Save the form (which saves profile_image if uploaded)
             form.save()
+            changed = list(form.changed_data)
+            if cropped_b64 and 'profile_image' not in changed:
+                changed.append('profile_image')
+            activity.record('profile_updated', user, fields=changed)
             messages.success(request, "Profile updated successfully.")
             return redirect('accounts:profile')
         else:
@@ -106,6 +111,7 @@ def request_otp_view(request):
             user = form.user
             # Optionally, we can throttle OTP creation per user here
             create_and_send_otp(user)
+            activity.record('otp_requested', user)
             messages.success(request, "OTP sent to your email. Check inbox and spam (10 min expiry).")
             return redirect(reverse('accounts:verify_otp') + f"?email={user.email}")
         else:
@@ -149,6 +155,7 @@ def verify_otp_view(request):
             user.set_password(new_password)
             user.save()
             otp.mark_used()
+            activity.record('password_reset', user)
             messages.success(request, "Password reset successful. You can now login.")
             return redirect('accounts:login')
         else:
@@ -0,0 +1,208 @@
+// static/js/base.js
+// Site-wide behaviour shared by every page (drawer, logout confirm, live search).
+
+/* ======= Drawer + Logout ======= */
+(function(){
+  const hamburger = document.getElementById('hamburger');
+  const drawer = document.getElementById('drawer');
+  const overlay = document.getElementById('drawerOverlay');
+  const logoutBtn = document.getElementById('logoutBtn');
+  const drawerLogoutBtn = document.getElementById('drawerLogoutBtn');
+  const confirmLogoutModalEl = document.getElementById('confirmLogoutModal');
+  const confirmLogoutModal = confirmLogoutModalEl ? new bootstrap.Modal(confirmLogoutModalEl) : null;
+
+  if (!hamburger || !drawer || !overlay) return;
+
+  function openDrawer() {
+    drawer.classList.add('open');
+    overlay.classList.add('show');
+    hamburger.classList.add('open');
+    document.body.style.overflow = 'hidden';
+  }
+  function closeDrawer() {
+    drawer.classList.remove('open');
+    overlay.classList.remove('show');
+    hamburger.classList.remove('open');
+    document.body.style.overflow = '';
+  }
+
+  hamburger.addEventListener('click', function(e){
+    e.stopPropagation();
+    if (drawer.classList.contains('open')) closeDrawer(); else openDrawer();
+  });
+
+  overlay.addEventListener('click', closeDrawer);
+  window.addEventListener('keydown', function(ev){
+    if (ev.key === 'Escape' && drawer.classList.contains('open')) closeDrawer();
+  });
+
+  if (logoutBtn && confirmLogoutModal) {
+    logoutBtn.addEventListener('click', function(e){
+      e.preventDefault();
+      confirmLogoutModal.show();
+    });
+  }
+  if (drawerLogoutBtn && confirmLogoutModal) {
+    drawerLogoutBtn.addEventListener('click', function(e){
+      e.preventDefault();
+      confirmLogoutModal.show();
+    });
+  }
+
+  // the task list copy main.js keeps in IndexedDB must not outlive the session
+  const logoutForm = document.getElementById('logoutForm');
+  if (logoutForm && window.indexedDB) {
+    logoutForm.addEventListener('submit', function(){
+      indexedDB.deleteDatabase('task-store');
+    });
+  }
+
+  setTimeout(()=>{ drawer.style.visibility = 'visible'; }, 50);
+})();
+
+/* ======= Live search (desktop + drawer) ======= */
+(function(){
+  function debounce(fn, wait) {
+    let t;
+    return function(...args) {
+      clearTimeout(t);
+      t = setTimeout(() => fn.apply(this, args), wait);
+    };
+  }
+  const apiBase = '/api/tasks/';
+  const desktopInput = document.getElementById('navSearchInput');
+  const desktopForm  = document.getElementById('navSearchForm');
+  const desktopResultsContainer = document.getElementById('searchResultsContainer');
+
+  const drawerInput = document.getElementById('drawerSearchInput');
+  const drawerForm  = document.getElementById('drawerSearchForm');
+  const drawerResultsContainer = document.getElementById('drawerSearchResults');
+
+  function makeResultsList(isDrawer){
+    const el = document.createElement('div');
+    el.className = 'shadow-sm';
+    el.style.background = '#fff';
+    el.style.border = '1px solid rgba(0,0,0,0.08)';
+    el.style.boxShadow = '0 6px 20px rgba(0,0,0,0.08)';
+    el.style.zIndex = 4000;
+    el.style.maxHeight = '360px';
+    el.style.overflowY = 'auto';
+    el.style.display = 'none';
+    el.style.borderRadius = '6px';
+    if (!isDrawer) {
+      el.style.position = 'absolute';
+      el.style.left = '0'; el.style.right = '0';
+    } else {
+      el.style.position = 'static';
+    }
+    return el;
+  }
+
+  let desktopList = null;
+  let drawerList = null;
+  if (desktopResultsContainer) {
+    desktopList = makeResultsList(false);
+    desktopResultsContainer.appendChild(desktopList);
+  }
+  if (drawerResultsContainer) {
+    drawerList = makeResultsList(true);
+    drawerResultsContainer.appendChild(drawerList);
+  }
+
+  function renderResultsInto(listEl, tasks){
+    if (!listEl) return;
+    if (!tasks || tasks.length === 0) {
+      listEl.innerHTML = '<div class="p-3 text-muted small">No results</div>';
+      listEl.style.display = 'block';
+      return;
+    }
+    listEl.innerHTML = tasks.map(t => {
+      const title = (t.title || '').replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
+      return `
+        <a href="#" class="search-item d-block p-3 text-decoration-none" data-id="${t.id}" style="border-bottom:1px solid rgba(0,0,0,0.04); color:#222;">
+          <div class="fw-semibold">${title}</div>
+        </a>`;
+    }).join('');
+    listEl.style.display = 'block';
+  }
+
+  // one request in flight per list: a newer keystroke aborts the older request
+  const inFlight = new Map();
+
+  async function searchTasksAndRender(q, listEl){
+    const previous = inFlight.get(listEl);
+    if (previous) previous.abort();
+
+    if (!q || q.trim().length === 0) {
+      if (listEl) listEl.style.display = 'none';
+      return;
+    }
+    const controller = new AbortController();
+    inFlight.set(listEl, controller);
+    // title prefix suggestions: a handful of {id, title}, not full tasks
+    const url = apiBase + 'suggest/?prefix=' + encodeURIComponent(q.trim());
+    try {
+      const res = await fetch(url, { credentials: 'same-origin', signal: controller.signal });
+      if (!res.ok) throw new Error('Search error');
+      const data = await res.json();
+      renderResultsInto(listEl, data);
+    } catch (err) {
+      if (err.name === 'AbortError') return;
+      if (listEl) {
+        listEl.innerHTML = '<div class="p-3 text-danger small">Search failed</div>';
+        listEl.style.display = 'block';
+      }
+      console.error('search error', err);
+    } finally {
+      if (inFlight.get(listEl) === controller) inFlight.delete(listEl);
+    }
+  }
+
+  const debouncedDesktop = debounce((e) => searchTasksAndRender(e.target.value, desktopList), 250);
+  const debouncedDrawer  = debounce((e) => searchTasksAndRender(e.target.value, drawerList), 250);
+
+  if (desktopInput) {
+    desktopInput.addEventListener('input', debouncedDesktop);
+    desktopForm && desktopForm.addEventListener('submit', function(e){
+      e.preventDefault(); // prevent full-page submit for live search; remove if you prefer full submit
+    });
+    desktopList && desktopList.addEventListener('click', function(ev){
+      ev.preventDefault();
+      const item = ev.target.closest('.search-item');
+      if(!item) return;
+      const id = item.getAttribute('data-id');
+      if (typeof openEdit === 'function') {
+        openEdit(id);
+      } else {
+        console.log('clicked', id);
+      }
+      desktopList.style.display = 'none';
+    });
+    document.addEventListener('click', function(e){
+      if (!desktopResultsContainer) return;
+      if (!desktopResultsContainer.contains(e.target)) {
+        desktopList && (desktopList.style.display = 'none');
+      }
+    });
+  }
+
+  if (drawerInput) {
+    drawerInput.addEventListener('input', debouncedDrawer);
+    drawerForm && drawerForm.addEventListener('submit', function(e){
+      e.preventDefault();
+    });
+    drawerList && drawerList.addEventListener('click', function(ev){
+      ev.preventDefault();
+      const item = ev.target.closest('.search-item');
+      if(!item) return;
+      const id = item.getAttribute('data-id');
+      if (typeof openEdit === 'function') {
+        openEdit(id);
+      } else {
+        console.log('drawer clicked', id);
+      }
+      drawerList.style.display = 'none';
+    });
+  }
+
+})();
@@ -22,7 +22,10 @@
     let currentFilter = 'all';
     let currentQuery = '';
     let currentOrdering = 'newest';
-    let tasksCache = [];
+    let currentTag = '';
+    let includeArchived = false;  // Completed filter only
+    let currentUser = null;
+    let currentCounts = null;
 
     /* ======= Utils ======= */
     function qs(params) {
@@ -51,23 +54,227 @@
         return `<span class="badge bg-${color} text-uppercase"><i class="bi ${icon} me-1"></i>${text}</span>`;
     }
 
+    /* ======= Task store ======= */
+    // One normalized copy of every task seen (byId) plus the ids of the list on screen
+    // (order). Mutations are applied here first and undone if the server refuses them;
+    // renderTasks() then only rebuilds the cards whose task changed.
+    const store = {
+        byId: new Map(),
+        order: [],
+        get(id) { return this.byId.get(String(id)); },
+        tasks() { return this.order.map(id => this.byId.get(id)).filter(Boolean); },
+    };
+    let tempIds = 0;
+
+    function listKey() {
+        return [currentUser, currentFilter, currentQuery, currentTag, currentOrdering, includeArchived].join('|');
+    }
+
+    // does a task belong in the list for the current filter/search/tag?
+    function matchesList(t) {
+        if (currentFilter === 'pending' && t.status === 'done') return false;
+        if (currentFilter === 'completed' && t.status !== 'done') return false;
+        if (currentFilter === 'favorites' && !t.is_favorite) return false;
+        if (currentQuery && !(t.title || '').toLowerCase().includes(currentQuery.toLowerCase())) return false;
+        if (currentTag && !(t.tags || []).some(tag => tag.toLowerCase() === currentTag.toLowerCase())) return false;
+        return true;
+    }
+
+    function compareTasks(a, b) {
+        switch (currentOrdering) {
+            case 'oldest': return new Date(a.created_at) - new Date(b.created_at);
+            case 'title_asc': return (a.title || '').localeCompare(b.title || '');
+            case 'title_desc': return (b.title || '').localeCompare(a.title || '');
+            case 'manual': return (a.position || 0) - (b.position || 0);
+            default: return new Date(b.created_at || Date.now()) - new Date(a.created_at || Date.now());
+        }
+    }
+
+    function setList(items) {
+        items.forEach(t => store.byId.set(String(t.id), t));
+        store.order = items.map(t => String(t.id));
+    }
+
+    // put a created/changed task in the store and move it in, out of or within the list
+    function applyTask(t, replacesId) {
+        const id = String(t.id);
+        if (replacesId !== undefined && String(replacesId) !== id) {
+            store.byId.delete(String(replacesId));
+            store.order = store.order.map(x => x === String(replacesId) ? id : x);
+        }
+        store.byId.set(id, t);
+        const at = store.order.indexOf(id);
+        if (at !== -1) store.order.splice(at, 1);
+        if (!matchesList(t)) return;
+        if (at !== -1 && (currentOrdering === 'newest' || currentOrdering === 'oldest')) {
+            store.order.splice(at, 0, id);  // created_at never changes
+            return;
+        }
+        let index = store.order.findIndex(other => compareTasks(t, store.byId.get(other)) < 0);
+        if (index === -1) index = store.order.length;
+        store.order.splice(index, 0, id);
+    }
+
+    function removeTask(id) {
+        id = String(id);
+        store.byId.delete(id);
+        store.order = store.order.filter(x => x !== id);
+    }
+
+    // what one task adds to each filter count (see task_counts in views.py)
+    function countsOf(t) {
+        return {
+            all: 1,
+            pending: t.status !== 'done' ? 1 : 0,
+            completed: t.status === 'done' ? 1 : 0,
+            favorites: t.is_favorite ? 1 : 0,
+            shared: t.access_role && t.access_role !== 'owner' ? 1 : 0,
+        };
+    }
+
+    function adjustCounts(before, after) {
+        if (!currentCounts) return;
+        const minus = before ? countsOf(before) : {};
+        const plus = after ? countsOf(after) : {};
+        for (const key of Object.keys({...minus, ...plus})) {
+            if (key in currentCounts) currentCounts[key] += (plus[key] || 0) - (minus[key] || 0);
+        }
+        renderCounts(currentCounts);
+    }
+
+    /* ======= Offline copy (IndexedDB) ======= */
+    // The last known version of every list is kept in IndexedDB, so a reload or a switch
+    // back to a filter paints at once while fresh data is fetched. Entries are per user
+    // and the database is dropped on logout (base.js).
+    const idb = (function(){
+        if (!window.indexedDB) return null;
+        let dbPromise = null;
+
+        function open() {
+            if (!dbPromise) {
+                dbPromise = new Promise((resolve, reject) => {
+                    const req = indexedDB.open('task-store', 1);
+                    req.onupgradeneeded = () => {
+                        req.result.createObjectStore('tasks', { keyPath: 'id' });
+                        req.result.createObjectStore('lists');
+                    };
+                    req.onsuccess = () => {
+                        // let logout delete the database while this page is open
+                        req.result.onversionchange = () => req.result.close();
+                        resolve(req.result);
+                    };
+                    req.onerror = () => reject(req.error);
+                });
+            }
+            return dbPromise;
+        }
+
+        function request(req) {
+            return new Promise((resolve, reject) => {
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+        }
+
+        function finished(tx) {
+            return new Promise((resolve, reject) => {
+                tx.oncomplete = resolve;
+                tx.onerror = tx.onabort = () => reject(tx.error);
+            });
+        }
+
+        async function run(mode, fn) {
+            try {
+                const db = await open();
+                const tx = db.transaction(['tasks', 'lists'], mode);
+                const result = await fn(tx.objectStore('tasks'), tx.objectStore('lists'));
+                await finished(tx);
+                return result;
+            } catch (err) {
+                console.warn('task store', err);
+                return null;
+            }
+        }
+
+        return {
+            loadList(key) {
+                return run('readonly', async (tasks, lists) => {
+                    const ids = await request(lists.get(key));
+                    if (!ids) return null;
+                    const items = await Promise.all(ids.map(id => request(tasks.get(id))));
+                    return items.every(Boolean) ? items : null;
+                });
+            },
+            saveList(key, items) {
+                return run('readwrite', async (tasks, lists) => {
+                    items.forEach(t => tasks.put(t));
+                    lists.put(items.map(t => t.id), key);
+                });
+            },
+            putTask(t) {
+                return run('readwrite', async tasks => { tasks.put(t); });
+            },
+            deleteTask(id) {
+                // lists that still name the task are ignored by loadList and refreshed on fetch
+                return run('readwrite', async tasks => { tasks.delete(Number(id)); });
+            },
+            clearIfOtherUser(user) {
+                return run('readwrite', async (tasks, lists) => {
+                    const owner = await request(lists.get('user'));
+                    if (owner !== undefined && owner !== user) {
+                        tasks.clear();
+                        lists.clear();
+                    }
+                    lists.put(user, 'user');
+                });
+            },
+        };
+    })();
+
+    function persistList() {
+        if (idb && currentUser !== null) idb.saveList(listKey(), store.tasks().filter(t => !t.pending));
+    }
+
+    function persistTask(t) {
+        if (idb && currentUser !== null && !t.pending) idb.putTask(t);
+    }
+
     /* ======= Fetch & render tasks (respects filters/search/sort) ======= */
+    let fetchSeq = 0;
+    let shownKey = null;  // listKey() of the list on screen
+
     async function fetchTasks() {
         const navInput = document.getElementById('navSearchInput');
         currentQuery = navInput ? navInput.value.trim() : currentQuery;
+        const seq = ++fetchSeq;
+
+        // paint the last known version of this list first (stale-while-revalidate)
+        if (idb && currentUser !== null) {
+            const cached = await idb.loadList(listKey());
+            if (cached && seq === fetchSeq) {
+                setList(cached);
+                shownKey = listKey();
+                renderTasks();
+            }
+        }
 
         const params = {};
         if (currentQuery) params.q = currentQuery;
 
         if (currentFilter === 'pending') params.status = 'pending';
-        else if (currentFilter === 'completed') params.status = 'done';
+        else if (currentFilter === 'completed') {
+            params.status = 'done';
+            if (includeArchived) params.include_archived = '1';
+        }
         else if (currentFilter === 'favorites') params.favorite = '1';
+        if (currentTag) params.tag = currentTag;
 
         const orderingMap = {
             'newest': '-created_at',
             'oldest': 'created_at',
             'title_asc': 'title',
-            'title_desc': '-title'
+            'title_desc': '-title',
+            'manual': 'position'
         };
         params.ordering = orderingMap[currentOrdering] || orderingMap['newest'];
 
@@ -83,33 +290,75 @@
             if (currentFilter === 'pending') {
                 items = items.filter(t => t.status !== 'done');
             }
+            // a newer fetch (filter changed meanwhile) wins
+            if (seq !== fetchSeq) return;
 
-            tasksCache = items;
-            renderTasks(items);
+            setList(items);
+            shownKey = listKey();
+            renderTasks();
+            persistList();
         } catch (err) {
             console.error('fetchTasks', err);
+            if (seq !== fetchSeq || shownKey === listKey()) return;  // keep showing the cached list
+            renderedCards.clear();
             const container = document.getElementById('tasksList');
             container.innerHTML = '<div class="col-12"><div class="alert alert-danger"><i class="bi bi-exclamation-triangle me-2"></i>Could not load tasks. Try reloading.</div></div>';
         }
     }
 
-    function renderTasks(tasks){
+    // id -> {el, key}: the card on screen and the task data it was built from
+    const renderedCards = new Map();
+
+    function renderTasks(){
         const container = document.getElementById('tasksList');
-        container.innerHTML = '';
-        if(!tasks || tasks.length === 0){
+        const tasks = store.tasks();
+        if(tasks.length === 0){
+            renderedCards.clear();
             let message = 'No tasks found.';
             if(currentFilter !== 'all' || currentQuery) {
                 message = `No ${currentFilter === 'pending' ? 'pending' : currentFilter} tasks found.`;
             }
+            if (currentTag) message = `No tasks tagged #${escapeHtml(currentTag)}.`;
             container.innerHTML = `<div class="col-12"><div class="alert alert-info border-0 shadow-sm"><i class="bi bi-info-circle me-2"></i>${message}</div></div>`;
             return;
         }
+        // drop the empty/error message and cards that left the list
+        const listed = new Set(store.order);
+        [...container.children].forEach(el => {
+            if (!listed.has(el.dataset.id)) el.remove();
+        });
+        for (const id of [...renderedCards.keys()]) {
+            if (!renderedCards.get(id).el.isConnected) renderedCards.delete(id);
+        }
 
-        tasks.forEach(t=>{
-            const col = document.createElement('div');
-            col.className='col-12 col-sm-6 col-lg-4';
+        // rebuild changed cards only, then put them in order with as few DOM moves as possible
+        let cursor = container.firstElementChild;
+        tasks.forEach(t => {
+            const id = String(t.id);
+            const key = JSON.stringify(t) + currentOrdering;
+            let card = renderedCards.get(id);
+            if (!card || card.key !== key) {
+                const el = buildCard(t);
+                if (card) card.el.replaceWith(el);
+                card = {el, key};
+                renderedCards.set(id, card);
+            }
+            if (card.el !== cursor) container.insertBefore(card.el, cursor);
+            cursor = card.el.nextElementSibling;
+        });
+    }
 
-            col.innerHTML = `
+    function buildCard(t){
+        const col = document.createElement('div');
+        col.className='col-12 col-sm-6 col-lg-4';
+        col.dataset.id = t.id;
+        // cards can be dragged to reorder in the manual sort
+        col.draggable = currentOrdering === 'manual' && !t.pending;
+        // optimistic cards wait for their id before they can be used
+        if (t.pending) col.classList.add('opacity-75');
+        const disabled = t.pending ? 'disabled' : '';
+
+        col.innerHTML = `
                 <div class="card shadow-sm h-100">
                     <div class="card-body d-flex flex-column">
                         <div class="d-flex justify-content-between align-items-start mb-2">
@@ -123,26 +372,32 @@
                         <p class="card-text text-muted flex-grow-1 small" style="white-space: pre-wrap; word-break: break-word; overflow: hidden; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;">
                             ${escapeHtml(t.description||'No description.')}
                         </p>
+                        ${(t.tags || []).length ? `<div class="mb-2">${t.tags.map(tag => `<span class="badge rounded-pill text-bg-light border me-1" role="button" data-tag="${escapeHtml(tag)}">#${escapeHtml(tag)}</span>`).join('')}</div>` : ''}
+                        ${t.subtask_count ? `<div class="mb-2 small text-muted"><i class="bi bi-list-check me-1"></i>${t.subtask_done_count}/${t.subtask_count} subtasks
+                            <div class="progress mt-1" style="height: 4px;"><div class="progress-bar bg-success" style="width: ${Math.round(100 * t.subtask_done_count / t.subtask_count)}%"></div></div>
+                        </div>` : ''}
 
                         <div class="mt-2 pt-2 border-top">
                             <div class="d-flex justify-content-between align-items-center mb-2">
-                                <small class="text-muted"><i class="bi bi-clock me-1"></i>Created: ${new Date(t.created_at).toLocaleDateString()}</small>
+                                <small class="text-muted"><i class="bi bi-clock me-1"></i>Created: ${new Date(t.created_at || Date.now()).toLocaleDateString()}</small>
+                                ${t.access_role && t.access_role !== 'owner' ? `<small class="text-muted"><i class="bi bi-people me-1"></i>${escapeHtml(t.owner_username || t.owner_email)} (${t.access_role})</small>` : ''}
+                                ${t.due_at ? `<small class="${t.status !== 'done' && new Date(t.due_at) < new Date() ? 'text-danger' : 'text-muted'}"><i class="bi bi-calendar-event me-1"></i>Due: ${new Date(t.due_at).toLocaleString()}</small>` : ''}
                             </div>
 
                             <div class="d-grid gap-2 d-sm-flex justify-content-md-end">
-                                <button class="btn btn-sm btn-outline-primary" onclick="openView(${t.id})">
+                                <button class="btn btn-sm btn-outline-primary" onclick="openView(${t.id})" ${disabled}>
                                     <i class="bi bi-eye"></i> View
                                 </button>
 
-                                <button class="btn btn-sm btn-outline-dark" onclick="openEdit(${t.id})">
+                                <button class="btn btn-sm btn-outline-dark" onclick="openEdit(${t.id})" ${disabled}>
                                     <i class="bi bi-pencil-square"></i> Edit
                                 </button>
 
-                                <button class="btn btn-sm btn-outline-danger" onclick="deleteTask(${t.id})">
+                                <button class="btn btn-sm btn-outline-danger" onclick="deleteTask(${t.id})" ${disabled}>
                                     <i class="bi bi-trash"></i> Delete
                                 </button>
 
-                                <button class="btn btn-sm ${t.is_favorite? 'btn-info' : 'btn-outline-info'}" onclick="toggleFav(${t.id})">
+                                <button class="btn btn-sm ${t.is_favorite? 'btn-info' : 'btn-outline-info'}" onclick="toggleFav(${t.id})" ${disabled}>
                                     <i class="bi ${t.is_favorite? 'bi-star-fill' : 'bi-star'}"></i> ${t.is_favorite? 'Unfav' : 'Fav'}
                                 </button>
                             </div>
@@ -150,8 +405,85 @@
                     </div>
                 </div>
             `;
-            container.appendChild(col);
+        return col;
+    }
+
+    /* ======= Drag & drop (manual order) ======= */
+    const tasksListEl = document.getElementById('tasksList');
+    let draggedId = null;
+
+    async function moveTask(id, afterId, beforeId) {
+        const res = await fetch(apiBase + id + '/move/', {
+            method: 'POST',
+            headers: {'Content-Type':'application/json', 'X-CSRFToken': csrftoken},
+            credentials: 'same-origin',
+            body: JSON.stringify({ after: afterId, before: beforeId })
         });
+        if (!res.ok) throw new Error('Move failed: ' + res.status);
+        return res.json();
+    }
+
+    if (tasksListEl) {
+        tasksListEl.addEventListener('dragstart', e => {
+            const col = e.target.closest('[data-id]');
+            if (!col || currentOrdering !== 'manual') return;
+            draggedId = col.dataset.id;
+            e.dataTransfer.effectAllowed = 'move';
+            col.classList.add('opacity-50');
+        });
+        tasksListEl.addEventListener('dragend', e => {
+            const col = e.target.closest('[data-id]');
+            if (col) col.classList.remove('opacity-50');
+            draggedId = null;
+        });
+        tasksListEl.addEventListener('dragover', e => {
+            if (draggedId) e.preventDefault();
+        });
+        tasksListEl.addEventListener('drop', async e => {
+            e.preventDefault();
+            const target = e.target.closest('[data-id]');
+            if (!draggedId || !target || target.dataset.id === draggedId) return;
+            const dragged = tasksListEl.querySelector(`[data-id="${draggedId}"]`);
+            // dropping on a card below moves after it, on a card above moves before it
+            const movingDown = dragged.compareDocumentPosition(target) & Node.DOCUMENT_POSITION_FOLLOWING;
+            tasksListEl.insertBefore(dragged, movingDown ? target.nextSibling : target);
+
+            const prev = dragged.previousElementSibling;
+            const next = dragged.nextElementSibling;
+            store.order = [...tasksListEl.children].map(el => el.dataset.id).filter(Boolean);
+            try {
+                const moved = await moveTask(dragged.dataset.id, prev ? prev.dataset.id : null, next ? next.dataset.id : null);
+                const task = store.get(moved.id);
+                if (task) {
+                    task.position = moved.position;
+                    persistTask(task);
+                }
+                persistList();
+            } catch (err) {
+                console.error('moveTask', err);
+                fetchTasks();  // put the list back in server order
+            }
+        });
+    }
+
+    /* ======= Filter counts ======= */
+    function renderCounts(counts) {
+        if (!counts) return;
+        currentCounts = counts;
+        document.querySelectorAll('[data-count]').forEach(el => {
+            const key = el.getAttribute('data-count');
+            if (key in counts) el.textContent = counts[key];
+        });
+    }
+
+    async function refreshCounts() {
+        try {
+            const res = await fetch(apiBase + 'stats/', { credentials: 'same-origin' });
+            if (!res.ok) throw new Error('Stats failed: ' + res.status);
+            renderCounts(await res.json());
+        } catch (err) {
+            console.error('refreshCounts', err);
+        }
     }
 
     /* ======= Modal Handling (single instances) ======= */
@@ -186,6 +518,16 @@
     }
 
     /* ======= Modal / form handling ======= */
+    // <input type="datetime-local"> works in local time without a zone; the API speaks ISO 8601
+    function toLocalInput(iso){
+        if (!iso) return '';
+        const d = new Date(iso);
+        return new Date(d.getTime() - d.getTimezoneOffset() * 60000).toISOString().slice(0, 16);
+    }
+    function fromLocalInput(value){
+        return value ? new Date(value).toISOString() : null;
+    }
+
     const newTaskBtn = document.getElementById('newTaskBtn');
     if (newTaskBtn && taskModal) {
         newTaskBtn.addEventListener('click', ()=>{
@@ -193,7 +535,10 @@
             document.getElementById('taskId').value='';
             document.getElementById('taskTitle').value='';
             document.getElementById('taskDesc').value='';
+            document.getElementById('taskTags').value='';
             document.getElementById('taskStatus').value='todo';
+            document.getElementById('taskDue').value='';
+            document.getElementById('taskRemind').value='';
             taskModal.show();
         });
     }
@@ -206,8 +551,21 @@
             const payload = {
                 title: document.getElementById('taskTitle').value,
                 description: document.getElementById('taskDesc').value,
-                status: document.getElementById('taskStatus').value
+                tags: document.getElementById('taskTags').value.split(',').map(tag => tag.trim()).filter(Boolean),
+                status: document.getElementById('taskStatus').value,
+                due_at: fromLocalInput(document.getElementById('taskDue').value),
+                remind_at: fromLocalInput(document.getElementById('taskRemind').value)
             };
+            // show the change at once, the server's answer replaces it (or undoes it)
+            const before = id ? store.get(id) : null;
+            const optimistic = before
+                ? {...before, ...payload}
+                : {...payload, id: --tempIds, pending: true, is_favorite: false, access_role: 'owner',
+                   created_at: new Date().toISOString(), position: -Infinity};
+            applyTask(optimistic);
+            adjustCounts(before, optimistic);
+            renderTasks();
+            if (taskModal) taskModal.hide();
             try {
                 const method = id ? 'PUT' : 'POST';
                 const url = id ? apiBase + id + '/' : apiBase;
@@ -221,27 +579,45 @@
                     const txt = await res.text();
                     throw new Error('Save failed: ' + res.status + ' ' + txt);
                 }
-                // Hide and refresh
-                if (taskModal) taskModal.hide();
-                fetchTasks();
+                const saved = await res.json();
+                applyTask(saved, optimistic.id);
+                adjustCounts(optimistic, saved);
+                renderTasks();
+                persistTask(saved);
+                persistList();
             } catch(err){
                 console.error('Task Save Error:', err);
+                adjustCounts(optimistic, before);
+                if (before) applyTask(before, optimistic.id); else removeTask(optimistic.id);
+                renderTasks();
                 alert('Error saving task — check console for details.');
             }
         });
     }
 
     // Edit (load data and open modal)
+    // tasks in the store are what the API returned, no need to load them again
+    async function loadTask(id) {
+        const cached = store.get(id);
+        if (cached) return cached;
+        const res = await fetch(apiBase + id + '/', { credentials:'same-origin' });
+        if (!res.ok) throw new Error('Load failed');
+        const task = await res.json();
+        store.byId.set(String(task.id), task);
+        return task;
+    }
+
     window.openEdit = async function(id){
         try {
-            const res = await fetch(apiBase + id + '/', { credentials:'same-origin' });
-            if (!res.ok) throw new Error('Load failed');
-            const data = await res.json();
+            const data = await loadTask(id);
             document.getElementById('taskModalTitle').textContent=`Edit Task: ${data.title}`;
             document.getElementById('taskId').value = data.id;
             document.getElementById('taskTitle').value = data.title;
             document.getElementById('taskDesc').value = data.description;
+            document.getElementById('taskTags').value = (data.tags || []).join(', ');
             document.getElementById('taskStatus').value = data.status;
+            document.getElementById('taskDue').value = toLocalInput(data.due_at);
+            document.getElementById('taskRemind').value = toLocalInput(data.remind_at);
             if (taskModal) taskModal.show();
         } catch(err){ console.error(err); alert('Could not load task'); }
     };
@@ -249,9 +625,7 @@
     // View-only (new)
     window.openView = async function(id) {
         try {
-            const res = await fetch(apiBase + id + '/', { credentials:'same-origin' });
-            if (!res.ok) throw new Error('Load failed');
-            const t = await res.json();
+            const t = await loadTask(id);
             document.getElementById('viewModalTitle').textContent = `Task: ${t.title}`;
             document.getElementById('viewTitle').textContent = t.title;
             document.getElementById('viewDescription').textContent = t.description || 'No description.';
@@ -265,8 +639,24 @@
     };
 
     // Delete
+    // the task and every subtask of it the store knows about (the server deletes the whole subtree)
+    function subtreeOf(id) {
+        const ids = [String(id)];
+        for (let i = 0; i < ids.length; i++) {
+            for (const t of store.byId.values()) {
+                if (t.parent != null && String(t.parent) === ids[i]) ids.push(String(t.id));
+            }
+        }
+        return ids.map(x => store.get(x)).filter(Boolean);
+    }
+
     window.deleteTask = async function(id){
         if(!confirm('Are you sure you want to permanently delete this task?')) return;
+        const task = store.get(id);
+        const removed = subtreeOf(id);
+        const order = store.order.slice();
+        removed.forEach(t => { removeTask(t.id); adjustCounts(t, null); });
+        renderTasks();
         try {
             const res = await fetch(apiBase + id + '/', { 
                 method:'DELETE', 
@@ -274,33 +664,76 @@
                 credentials:'same-origin' 
             });
             if (res.status === 204 || res.ok) {
-                 fetchTasks();
+                if (idb) removed.forEach(t => idb.deleteTask(t.id));
+                // subtasks outside this list are gone too, and the parent's progress changed
+                persistList();
+                if (task && (task.subtask_count || task.parent != null)) {
+                    fetchTasks();
+                    refreshCounts();
+                }
             } else {
                 const txt = await res.text();
                 throw new Error('Delete failed: ' + res.status + ' ' + txt);
             }
-        } catch(err){ console.error(err); alert('Delete failed'); }
+        } catch(err){
+            console.error(err);
+            if (removed.length) {
+                removed.forEach(t => { store.byId.set(String(t.id), t); adjustCounts(null, t); });
+                const kept = new Set(store.order);
+                store.order = order.filter(x => kept.has(x) || removed.some(t => String(t.id) === x));
+                renderTasks();
+            }
+            alert('Delete failed');
+        }
     };
 
     // Toggle favorite
     window.toggleFav = async function(id){
+        const before = store.get(id);
+        if (before) {
+            const flipped = {...before, is_favorite: !before.is_favorite};
+            applyTask(flipped);
+            adjustCounts(before, flipped);
+            renderTasks();
+        }
         try {
             const res = await fetch(apiBase + id + '/toggle-favorite/', { method:'POST', headers:{ 'X-CSRFToken': csrftoken }, credentials:'same-origin' });
             if (!res.ok) {
                 const txt = await res.text();
                 throw new Error('Toggle failed: ' + res.status + ' ' + txt);
             }
-            if (currentFilter === 'favorites') {
-                tasksCache = tasksCache.filter(t => t.id !== id);
-                renderTasks(tasksCache);
-                return;
+            // {id, is_favorite}: the rest of the task did not change
+            const data = await res.json();
+            const current = store.get(data.id);
+            if (current && current.is_favorite !== data.is_favorite) {
+                const fixed = {...current, is_favorite: data.is_favorite};
+                applyTask(fixed);
+                adjustCounts(current, fixed);
+                renderTasks();
             }
-            fetchTasks();
-        } catch(err){ console.error(err); alert('Could not update favorite'); }
+            if (current) persistTask(store.get(data.id));
+            persistList();
+        } catch(err){
+            console.error(err);
+            if (before) {
+                adjustCounts(store.get(id), before);
+                applyTask(before);
+                renderTasks();
+            }
+            alert('Could not update favorite');
+        }
     };
 
     /* ======= Filter UI ======= */
     const filterGroup = document.getElementById('filterGroup');
+    const archivedToggle = document.getElementById('archivedToggle');
+    const includeArchivedInput = document.getElementById('includeArchived');
+    if (includeArchivedInput) {
+        includeArchivedInput.addEventListener('change', function(e){
+            includeArchived = e.target.checked;
+            fetchTasks();
+        });
+    }
     if (filterGroup) {
         filterGroup.addEventListener('click', function(e){
             const btn = e.target.closest('button[data-filter]');
@@ -310,6 +743,7 @@
             [...filterGroup.querySelectorAll('button')].forEach(b => b.classList.remove('active'));
             btn.classList.add('active');
             currentFilter = selected;
+            if (archivedToggle) archivedToggle.classList.toggle('d-none', selected !== 'completed');
             fetchTasks();
         });
     }
@@ -323,9 +757,48 @@
         });
     }
 
+    /* ======= Tag filter ======= */
+    // clicking a tag on a card lists only tasks with that tag, clicking it again clears it
+    const tasksList = document.getElementById('tasksList');
+    if (tasksList) {
+        tasksList.addEventListener('click', function(e){
+            const badge = e.target.closest('[data-tag]');
+            if (!badge) return;
+            const tag = badge.getAttribute('data-tag');
+            currentTag = currentTag === tag ? '' : tag;
+            fetchTasks();
+        });
+    }
+
     /* ======= Initial load ======= */
+    // tasks_index embeds the first tasks + counts (#initialTasks), render them
+    // straight away and only hit the API when there are more to load.
+    function hydrate() {
+        const el = document.getElementById('initialTasks');
+        if (!el) return false;
+        el.remove();
+        let data;
+        try {
+            data = JSON.parse(el.textContent);
+        } catch (err) {
+            console.error('hydrate', err);
+            return false;
+        }
+        currentUser = data.user === undefined ? null : data.user;
+        const items = data.results || [];
+        setList(items);
+        shownKey = listKey();
+        renderTasks();
+        renderCounts(data.counts);
+        const complete = !data.counts || items.length >= data.counts.all;
+        if (idb && currentUser !== null) {
+            idb.clearIfOtherUser(currentUser).then(() => { if (complete) persistList(); });
+        }
+        return complete;
+    }
+
     document.addEventListener('DOMContentLoaded', function(){
-        fetchTasks();
+        if (!hydrate()) fetchTasks();
     });
 
 })();
@@ -0,0 +1,76 @@
+# task_manager/db_router.py
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA_ALIAS = 'replica'
+
+# True while the current request must read from the primary (it writes, or the
+# client wrote recently and the replica may not have caught up yet)
+_use_primary = ContextVar('use_primary', default=False)
+
+
+def pin_primary(value=True):
+    """Send reads in the current context to the primary. Returns a token for unpin_primary()."""
+    return _use_primary.set(value)
+
+
+def unpin_primary(token):
+    _use_primary.reset(token)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.databases
+
+
+def shard_for_owner(owner_id):
+    """Database alias holding the tasks of owner_id, None when tasks are not sharded."""
+    shards = settings.TASK_SHARDS
+    if not shards or owner_id is None:
+        return None
+    return shards[owner_id % len(shards)]
+
+
+class OwnerShardRouter:
+    """
+    Keep every row of the tasks app in the shard of its owner (settings.TASK_SHARDS).
+    Routing needs an instance hint (a task, or the owning user for user.tasks);
+    without one the decision falls through to the next router. Views select the
+    shard explicitly with Task.objects.for_owner(user).
+    """
+
+    def _db_for(self, model, **hints):
+        if model._meta.app_label != 'tasks' or not settings.TASK_SHARDS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._meta.label == settings.AUTH_USER_MODEL:
+            return shard_for_owner(instance.pk)
+        return shard_for_owner(getattr(instance, 'owner_id', None))
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads go to the 'replica' alias when one is configured, writes always go to 'default'.
+    Reads stay on the primary when the request is pinned (see ReplicaRoutingMiddleware)
+    or when they happen inside a transaction on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_configured() or _use_primary.get():
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data
+        return True
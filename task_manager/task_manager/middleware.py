@@ -0,0 +1,164 @@
+# task_manager/middleware.py
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from tasks import activity
+
+from .db_router import pin_primary, replica_configured, unpin_primary
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+re_accepts_br = re.compile(r"\bbr\b")
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiate brotli or gzip for responses of at least COMPRESSION_MIN_SIZE bytes.
+
+    Brotli is only used for non-HTML bodies: HTML pages carry the CSRF token and
+    Django's gzip path pads its output against BREACH, brotli has no equivalent.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return super().process_response(request, response)
+
+        min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+        if len(response.content) < min_size:
+            return response
+
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        content_type = response.get("Content-Type", "")
+        if (
+            brotli is None
+            or not re_accepts_br.search(accept_encoding)
+            or content_type.startswith("text/html")
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        quality = getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5)
+        compressed_content = brotli.compress(response.content, quality=quality)
+        # don't send a "compressed" body that is bigger than the original
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+
+        # same as GZipMiddleware: a strong ETag no longer matches the encoded body
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pin reads to the primary for requests that write and, through a short-lived
+    cookie, for the same client's next requests so it always reads its own writes.
+    Everything else may be served from the replica by PrimaryReplicaRouter.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        sticky = settings.REPLICA_STICKY_COOKIE in request.COOKIES
+        token = pin_primary(writes or sticky)
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin_primary(token)
+
+        if writes and replica_configured() and settings.REPLICA_STICKY_SECONDS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Load shedding: when MAX_CONCURRENT_REQUESTS requests are already in flight, answer
+    503 with Retry-After at once instead of queueing more work behind them. 0 disables
+    the limit.
+
+    The in-flight count is one integer in the cache, moved with incr/decr like the
+    throttle buckets, so with a shared cache (REDIS_URL) it covers every worker; a
+    sync worker alone never runs more than its few threads at once. The key expires
+    after LOAD_SHED_COUNTER_TIMEOUT seconds, so requests of a killed worker do not
+    stay counted.
+    """
+    cache_key = 'load_shed:in_flight'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limit = settings.MAX_CONCURRENT_REQUESTS
+
+    def __call__(self, request):
+        if not self.limit:
+            return self.get_response(request)
+
+        if self.enter() > self.limit:
+            self.leave()
+            response = JsonResponse({'detail': 'Server is busy, please retry shortly.'}, status=503)
+            response['Retry-After'] = str(settings.LOAD_SHED_RETRY_AFTER)
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            self.leave()
+
+    def enter(self):
+        """Count this request in; returns the number of requests in flight."""
+        timeout = settings.LOAD_SHED_COUNTER_TIMEOUT
+        if cache.add(self.cache_key, 1, timeout):
+            return 1
+        try:
+            return cache.incr(self.cache_key)
+        except ValueError:
+            # expired between add() and incr()
+            cache.set(self.cache_key, 1, timeout)
+            return 1
+
+    def leave(self):
+        try:
+            cache.decr(self.cache_key)
+        except ValueError:
+            # expired meanwhile, the count started again from zero
+            pass
+
+
+class ActivityLogMiddleware:
+    """
+    Buffer the activity entries recorded while handling a request (tasks.activity)
+    and write them in one bulk insert at the end; requests that fail write nothing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = activity.start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            activity.finish(token, commit=response is not None and response.status_code < 400)
+        return response
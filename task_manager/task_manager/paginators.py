@@ -0,0 +1,53 @@
+# task_manager/paginators.py
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+def estimated_row_count(model, using='default'):
+    """Row count from the table statistics (MySQL/PostgreSQL), None when not available."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of big tables: an unfiltered changelist takes its
+    count from the table statistics instead of a COUNT(*) over every row. Filtered
+    querysets, small tables and SQLite keep the exact count.
+    """
+    exact_count_below = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(qs.model, qs.db)
+            if estimate is not None and estimate >= self.exact_count_below:
+                return estimate
+        return super().count
+
+
+class ActivityCursorPagination(CursorPagination):
+    """Keyset pages over an append-only log, newest first: no COUNT and no OFFSET scans."""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
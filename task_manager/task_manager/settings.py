@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # serves hashed static files (precompressed, immutable cache headers)
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # sheds load (503) before any session/auth/DB work is done
+    'task_manager.middleware.ConcurrencyLimitMiddleware',
+    # brotli/gzip for HTML and API responses; must run before anything that reads the body
+    'task_manager.middleware.CompressionMiddleware',
+    # reads of writing/recently-writing clients stay on the primary
+    'task_manager.middleware.ReplicaRoutingMiddleware',
+    # one insert per request for the activity log
+    'task_manager.middleware.ActivityLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,16 +86,84 @@ WSGI_APPLICATION = 'task_manager.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME':'secure_task_db',
-        'USER':'root',
-        'PASSWORD':'123456',
-        'HOST':'localhost',
-        'PORT':'3306',
+# Everything is overridable from the environment, defaults match the local MySQL setup.
+#   DB_ENGINE=sqlite          -> file based SQLite (DB_NAME or db.sqlite3), handy for tests
+#   DB_CONN_MAX_AGE=<seconds> -> keep connections open between requests (0 = per request, -1 = forever)
+#   DB_CONN_HEALTH_CHECKS=0   -> skip the ping before reusing a persistent connection
+#   DB_POOL=1                 -> MySQL connection pool (needs django-db-connection-pool)
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'mysql').lower()
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.environ.get('DB_NAME', 'secure_task_db'),
+            'USER': os.environ.get('DB_USER', 'root'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', '123456'),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '3306'),
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+    if os.environ.get('DB_POOL', '0') == '1':
+        # the pool owns the sockets, Django must not close them after each request
+        DATABASES['default']['ENGINE'] = 'dj_db_conn_pool.backends.mysql'
+        DATABASES['default']['POOL_OPTIONS'] = {
+            'POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', '10')),
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', '10')),
+            'RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', '3600')),
+        }
+        DB_CONN_MAX_AGE = 0
+
+DATABASES['default']['CONN_MAX_AGE'] = None if DB_CONN_MAX_AGE < 0 else DB_CONN_MAX_AGE
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1'
+
+# Optional read replica: DB_REPLICA_HOST (MySQL) or DB_REPLICA_NAME (SQLite file)
+# adds a 'replica' alias that task_manager.db_router sends safe reads to.
+# Tests mirror it onto the test 'default' database.
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DB_REPLICA_NAME = os.environ.get('DB_REPLICA_NAME')
+if DB_REPLICA_HOST or DB_REPLICA_NAME:
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DB_REPLICA_HOST:
+        DATABASES['replica']['HOST'] = DB_REPLICA_HOST
+        DATABASES['replica']['PORT'] = os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', ''))
+    if DB_REPLICA_NAME:
+        DATABASES['replica']['NAME'] = DB_REPLICA_NAME
+
+# Optional owner sharding of the tasks app: DB_TASK_SHARDS=<n> adds aliases shard_0..shard_<n-1>
+# (same server, database/file name suffixed with _shard_<i>). Users are replicated to every
+# shard, see tasks/sharding.py. Run `migrate --database=shard_<i>` for each shard and
+# `rebalance_task_shards` after changing the shard count.
+TASK_SHARDS = []
+for i in range(int(os.environ.get('DB_TASK_SHARDS', '0'))):
+    alias = f'shard_{i}'
+    DATABASES[alias] = {**DATABASES['default']}
+    if DB_ENGINE == 'sqlite':
+        DATABASES[alias]['NAME'] = Path(DATABASES['default']['NAME']).with_suffix(f'.shard_{i}.sqlite3')
+    else:
+        DATABASES[alias]['NAME'] = f"{DATABASES['default']['NAME']}_shard_{i}"
+    TASK_SHARDS.append(alias)
+
+DATABASE_ROUTERS = [
+    'task_manager.db_router.OwnerShardRouter',
+    'task_manager.db_router.PrimaryReplicaRouter',
+]
+
+# after a write the client reads from the primary for this long (replication lag budget)
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '5'))
+REPLICA_STICKY_COOKIE = 'pin_primary'
 
 
 # Password validation
@@ -126,6 +205,23 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_DIR = BASE_DIR / 'static'
 STATICFILES_DIRS = [STATIC_DIR]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# In production collectstatic writes content-hashed copies plus .gz/.br siblings
+# and WhiteNoise serves them with far-future immutable Cache-Control.
+# DEBUG keeps the plain storage so no collectstatic is needed while developing.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+            if DEBUG else
+            'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -150,8 +246,53 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
+    # token buckets, see task_manager/throttling.py ("<burst>/<period>")
+    "DEFAULT_THROTTLE_CLASSES": [
+        "task_manager.throttling.UserTokenBucketThrottle",
+        "task_manager.throttling.IPTokenBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "user_read": os.environ.get('THROTTLE_USER_READ', '300/min'),
+        "user_write": os.environ.get('THROTTLE_USER_WRITE', '60/min'),
+        "ip_read": os.environ.get('THROTTLE_IP_READ', '600/min'),
+        "ip_write": os.environ.get('THROTTLE_IP_WRITE', '120/min'),
+    },
 }
 
+# in-flight requests (counted in the cache, so across workers with REDIS_URL) before
+# ConcurrencyLimitMiddleware answers 503 (0 = off)
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '64'))
+LOAD_SHED_RETRY_AFTER = 1
+# the count is reset this often, so requests of a killed worker do not stay counted
+LOAD_SHED_COUNTER_TIMEOUT = 60
+
+# write activity log batches from a background thread instead of at the end of the request
+ACTIVITY_LOG_BACKGROUND = os.environ.get('ACTIVITY_LOG_BACKGROUND', '0') == '1'
+
+# Cache shared by all workers (throttle buckets, suggest LRU): set REDIS_URL in production,
+# the local-memory fallback is per process.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Response compression (task_manager.middleware.CompressionMiddleware)
+# bodies smaller than this are sent as-is, the headers would eat the savings
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# tasks embedded in the task page on first load, the rest is fetched by main.js
+TASKS_INITIAL_PAGE_SIZE = 50
+
 # settings.py
 
 AUTHENTICATION_BACKENDS = [
@@ -0,0 +1,90 @@
+# task_manager/throttling.py
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per client, with separate buckets for reads (safe methods) and writes.
+
+    Rates come from DEFAULT_THROTTLE_RATES['<scope>_read' / '<scope>_write'] as
+    "<burst>/<period>": the bucket holds <burst> tokens and refills over <period>.
+    It is stored as GCRA's "theoretical arrival time", one integer per client in the
+    cache, so a check is a single atomic cache.incr (plus a set when the bucket was
+    idle). With a shared cache (REDIS_URL) every worker sees the same buckets.
+    """
+    scope = None
+    cache = default_cache
+    # keys outlive the period so a busy client's bucket is not reset early
+    timeout_periods = 10
+
+    def get_client_ident(self, request):
+        """Bucket owner for this request, None to skip throttling."""
+        raise NotImplementedError
+
+    def parse_rate(self, rate):
+        num, period = rate.split('/')
+        return int(num), PERIODS[period[0]]
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        ident = self.get_client_ident(request)
+        kind = 'read' if request.method in SAFE_METHODS else 'write'
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{self.scope}_{kind}')
+        if ident is None or rate is None:
+            return True
+
+        burst, period = self.parse_rate(rate)
+        interval = max(1, period * 1000 // burst)  # ms per token
+        capacity = burst * interval
+        key = f'throttle:{self.scope}_{kind}:{ident}'
+        timeout = period * self.timeout_periods
+        now = int(time.time() * 1000)
+
+        if self.cache.add(key, now + interval, timeout):
+            return True
+        try:
+            tat = self.cache.incr(key, interval)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.set(key, now + interval, timeout)
+            return True
+        if tat < now + interval:
+            # the bucket had refilled completely, start again from now
+            self.cache.set(key, now + interval, timeout)
+            return True
+        if tat - now <= capacity:
+            return True
+
+        # refused requests don't take a token
+        self.cache.decr(key, interval)
+        self.wait_seconds = (tat - capacity - now) / 1000
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Buckets per authenticated user (scopes user_read / user_write)."""
+    scope = 'user'
+
+    def get_client_ident(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Buckets per client IP for every request (scopes ip_read / ip_write)."""
+    scope = 'ip'
+
+    def get_client_ident(self, request):
+        return self.get_ident(request)
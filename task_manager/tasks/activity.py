@@ -0,0 +1,102 @@
+"""
+Activity log writer.
+
+record() does not touch the database during a request: ActivityLogMiddleware
+gives every request a buffer and writes what was recorded with one bulk insert
+once the response is ready (and drops it for failed requests). With
+ACTIVITY_LOG_BACKGROUND the batch is handed to a writer thread instead, which
+also merges batches of concurrent requests into one insert. Outside a request
+(shell, management commands) entries are written right away.
+"""
+import logging
+import queue
+import threading
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Activity
+
+logger = logging.getLogger(__name__)
+
+_buffer = ContextVar('activity_buffer', default=None)
+
+
+def record(verb, actor=None, task=None, **changes):
+    """Log verb done by actor (a user) on task (a task or task id), with details in changes."""
+    entry = Activity(
+        actor_id=getattr(actor, 'pk', None),
+        task_id=getattr(task, 'pk', task),
+        verb=verb,
+        changes=changes,
+    )
+    buffer = _buffer.get()
+    if buffer is None:
+        write([entry])
+    else:
+        buffer.append(entry)
+
+
+def diff(before, instance):
+    """{field: [old, new]} for the fields of `before` whose value changed on instance."""
+    changes = {}
+    for field, old in before.items():
+        new = getattr(instance, field)
+        if old != new:
+            changes[field] = [old, new]
+    return changes
+
+
+def start():
+    """Start buffering in the current context. Returns a token for finish()."""
+    return _buffer.set([])
+
+
+def finish(token, commit=True):
+    """Stop buffering and write (or drop) what was recorded since start()."""
+    entries = _buffer.get()
+    _buffer.reset(token)
+    if commit and entries:
+        write(entries)
+
+
+def write(entries):
+    if settings.ACTIVITY_LOG_BACKGROUND:
+        _writer.put(entries)
+    else:
+        Activity.objects.using('default').bulk_create(entries)
+
+
+class BackgroundWriter:
+    """One daemon thread inserting queued batches, merged up to max_batch rows."""
+
+    def __init__(self, max_batch=500):
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def put(self, entries):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='activity-writer', daemon=True)
+                self.thread.start()
+        self.queue.put(entries)
+
+    def run(self):
+        while True:
+            entries = list(self.queue.get())
+            while len(entries) < self.max_batch:
+                try:
+                    entries.extend(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                Activity.objects.using('default').bulk_create(entries)
+            except Exception:
+                logger.exception('could not write %d activity entries', len(entries))
+                connections['default'].close()
+
+
+_writer = BackgroundWriter()
@@ -1,9 +1,56 @@
 # tasks/admin.py
 from django.contrib import admin
-from .models import Task
 
-@admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+from task_manager.paginators import EstimatedCountPaginator
+
+from .models import Task, TaskArchive
+from .subtasks import delete_subtree
+from .utils import normalize_title
+
+
+class ScalableTaskAdminMixin:
+    """
+    Changelist settings that stay fast with millions of rows: owner joined in the
+    list query, estimated total count, owner picked through autocomplete and only
+    indexed search lookups (see get_search_results).
+    """
     list_display = ('title', 'owner', 'status', 'is_favorite', 'created_at')
     list_filter = ('status', 'is_favorite')
-    search_fields = ('title', 'description', 'owner__username', 'owner__email')
+    list_select_related = ('owner',)
+    search_fields = ('^title', '=owner__email')
+    search_help_text = "Title prefix, or an owner's exact email address."
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # newest first through the primary key instead of sorting on created_at
+    ordering = ('-pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '@' in term:
+            # unique index on the user's email
+            return queryset.filter(owner__email__iexact=term), False
+        # index on title_normalized; istartswith because MySQL turns startswith into
+        # LIKE BINARY, which skips that index (the column is lowercase anyway)
+        return queryset.filter(title_normalized__istartswith=normalize_title(term)), False
+
+
+@admin.register(Task)
+class TaskAdmin(ScalableTaskAdminMixin, admin.ModelAdmin):
+    autocomplete_fields = ('owner', 'parent')
+
+    # deletes go through delete_subtree() so tag counters and parent progress stay right
+    def delete_model(self, request, obj):
+        delete_subtree(obj)
+
+    def delete_queryset(self, request, queryset):
+        for task in queryset:
+            delete_subtree(task)
+
+
+@admin.register(TaskArchive)
+class TaskArchiveAdmin(ScalableTaskAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'owner', 'status', 'created_at', 'archived_at')
+    list_filter = ()
+    raw_id_fields = ('owner',)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        # signal receivers: user replication for sharded storage, suggest cache invalidation,
+        # owner access for new tasks
+        from . import sharding, sharing, suggest  # noqa: F401
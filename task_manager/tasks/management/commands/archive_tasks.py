@@ -0,0 +1,57 @@
+# tasks/management/commands/archive_tasks.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from tasks.models import Task, TaskArchive
+from tasks.subtasks import detach
+from tasks.tags import release_tags
+from tasks.utils import insert_rows
+
+
+class Command(BaseCommand):
+    help = "Move tasks that have been done for a while from Task into TaskArchive, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='DAYS',
+                            help='archive done tasks not updated for this many days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='only count the tasks to archive')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        batch_size = options['batch_size']
+        total = 0
+
+        for using in ['default', *settings.TASK_SHARDS]:
+            # served by the (status, updated_at) index; tasks with subtasks stay until their
+            # subtasks are archived, deleting them would cascade to the subtree
+            candidates = Task._base_manager.using(using).filter(status='done', updated_at__lt=cutoff).exclude(
+                Exists(Task._base_manager.filter(parent_id=OuterRef('pk'))),
+            )
+            if options['dry_run']:
+                total += candidates.count()
+                continue
+            while True:
+                batch = list(candidates.order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                # one short transaction per batch keeps locks small on the hot table
+                with transaction.atomic(using=using):
+                    # archived tasks keep their tag names but leave the tag counters
+                    tags = release_tags([t.pk for t in batch], using)
+                    detach(batch, using)
+                    archives = [TaskArchive.from_task(t) for t in batch]
+                    for archive in archives:
+                        archive.tags = tags.get(archive.pk, [])
+                    insert_rows(TaskArchive, archives, using=using, ignore_conflicts=True)
+                    Task._base_manager.using(using).filter(pk__in=[t.pk for t in batch]).delete()
+                total += len(batch)
+                self.stdout.write(f"{using}: archived {len(batch)} task(s)")
+
+        verb = 'would archive' if options['dry_run'] else 'archived'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} task(s) done before {cutoff:%Y-%m-%d %H:%M}"))
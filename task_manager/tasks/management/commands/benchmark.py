@@ -0,0 +1,146 @@
+# tasks/management/commands/benchmark.py
+import statistics
+import time
+
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.test import Client, RequestFactory
+
+from task_manager.middleware import ConcurrencyLimitMiddleware
+from task_manager.throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+
+from tasks.models import Task
+from tasks.views import tasks_index
+
+
+def bench_connections(command, options):
+    """
+    Per-request connection overhead: replay the request_started/request_finished
+    signals around a tiny owner-scoped query (what TaskViewSet does) with
+    CONN_MAX_AGE=0 and then with persistent connections.
+    """
+    conn = connections['default']
+    configured_max_age = conn.settings_dict['CONN_MAX_AGE']
+    persistent_max_age = configured_max_age if configured_max_age != 0 else 60
+    results = {}
+    try:
+        for label, max_age in (('per-request', 0), ('persistent', persistent_max_age)):
+            conn.close()
+            conn.settings_dict['CONN_MAX_AGE'] = max_age
+            timings = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                request_started.send(sender=__name__)
+                list(Task.objects.filter(owner_id=0)[:1])
+                request_finished.send(sender=__name__)
+                timings.append(time.perf_counter() - start)
+            results[label] = timings
+            command.report(f'connections: {label} (CONN_MAX_AGE={max_age})', timings)
+    finally:
+        conn.close()
+        conn.settings_dict['CONN_MAX_AGE'] = configured_max_age
+
+    overhead = statistics.mean(results['per-request']) - statistics.mean(results['persistent'])
+    command.stdout.write(f'  connection overhead per request: {overhead * 1000:.3f} ms')
+
+
+def bench_first_paint(command, options):
+    """
+    Time to first task on the task page: the old empty page + /api/tasks/ one after
+    the other (the browser's old path) vs. the page with the embedded first page.
+    Both pages are rendered by calling the view, the API goes through the client.
+    Each extra sequential request also costs a network round trip, not included here.
+    """
+    user = get_user_model().objects.create_user(
+        f'bench-{uuid.uuid4().hex[:8]}@example.com', password=uuid.uuid4().hex
+    )
+    try:
+        for i in range(options['tasks']):
+            Task.objects.create(owner=user, title=f'Benchmark task {i}', status='done' if i % 3 == 0 else 'todo')
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+        request = RequestFactory().get('/', SERVER_NAME='localhost')
+        request.user = user
+
+        page_then_api, embedded = [], []
+        for _ in range(options['iterations']):
+            start = time.perf_counter()
+            # the page as it was before the tasks were embedded
+            render(request, 'tasks_index.html')
+            client.get('/api/tasks/?ordering=-created_at')
+            page_then_api.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            tasks_index(request)
+            embedded.append(time.perf_counter() - start)
+        command.report(f"first_paint: page then API ({options['tasks']} tasks)", page_then_api)
+        command.report(f"first_paint: embedded first page ({options['tasks']} tasks)", embedded)
+    finally:
+        user.delete()
+
+
+def bench_throttle(command, options):
+    """
+    Admission control cost per request: both token-bucket throttles (against the
+    configured cache) and the concurrency limiter, each timed around a no-op.
+    """
+    request = RequestFactory().get('/api/tasks/', REMOTE_ADDR='10.0.0.1')
+    request.user = get_user_model()(pk=10 ** 9)
+    throttles = [UserTokenBucketThrottle(), IPTokenBucketThrottle()]
+    for throttle in throttles:
+        # never refuse, we measure the bookkeeping
+        throttle.parse_rate = lambda rate: (10 ** 9, 1)
+
+    timings = []
+    for _ in range(options['iterations']):
+        start = time.perf_counter()
+        for throttle in throttles:
+            throttle.allow_request(request, None)
+        timings.append(time.perf_counter() - start)
+    command.report('throttle: user + ip token buckets', timings)
+
+    middleware = ConcurrencyLimitMiddleware(lambda r: HttpResponse())
+    timings = []
+    for _ in range(options['iterations']):
+        start = time.perf_counter()
+        middleware(request)
+        timings.append(time.perf_counter() - start)
+    command.report('throttle: concurrency limiter', timings)
+
+
+SCENARIOS = {
+    'connections': bench_connections,
+    'first_paint': bench_first_paint,
+    'throttle': bench_throttle,
+}
+
+
+class Command(BaseCommand):
+    help = "Run micro benchmarks against the configured database. Scenarios: " + ", ".join(SCENARIOS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='scenarios to run (default: all)')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--tasks', type=int, default=100, help='tasks created for data scenarios')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [n for n in names if n not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        for name in names:
+            SCENARIOS[name](self, options)
+
+    def report(self, label, timings):
+        ms = sorted(t * 1000 for t in timings)
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        self.stdout.write(
+            f'{label}: n={len(ms)} mean={statistics.mean(ms):.3f}ms '
+            f'median={statistics.median(ms):.3f}ms p95={p95:.3f}ms'
+        )
@@ -0,0 +1,59 @@
+# tasks/management/commands/rebalance_task_shards.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from task_manager.db_router import shard_for_owner
+from tasks.models import Task, TaskArchive
+from tasks.sharding import move_owner_tasks, stranded_collaborators
+
+
+class Command(BaseCommand):
+    help = "Move tasks to the shard of their owner (after enabling sharding or changing DB_TASK_SHARDS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='only report what would move')
+
+    def handle(self, *args, **options):
+        if not settings.TASK_SHARDS:
+            raise CommandError("Task sharding is not enabled (set DB_TASK_SHARDS).")
+
+        total = 0
+        stranded_total = 0
+        # 'default' holds everything created before sharding was switched on
+        for source in ['default', *settings.TASK_SHARDS]:
+            # owners with only archived tasks have to move as well
+            owner_ids = set()
+            for model in (Task, TaskArchive):
+                owner_ids.update(
+                    model._base_manager.using(source).order_by().values_list('owner_id', flat=True).distinct()
+                )
+            for owner_id in sorted(owner_ids):
+                target = shard_for_owner(owner_id)
+                if target == source:
+                    continue
+                if options['dry_run']:
+                    count = sum(
+                        model._base_manager.using(source).filter(owner_id=owner_id).count()
+                        for model in (Task, TaskArchive)
+                    )
+                    stranded = stranded_collaborators(owner_id, source)
+                else:
+                    count, stranded = move_owner_tasks(owner_id, source, batch_size=options['batch_size'])
+                total += count
+                stranded_total += len(stranded)
+                self.stdout.write(f"owner {owner_id}: {count} task(s) {source} -> {target}")
+                if stranded:
+                    users = ', '.join(map(str, stranded))
+                    self.stdout.write(self.style.WARNING(
+                        f"owner {owner_id}: shares with user(s) {users} on another shard "
+                        f"{'would be' if options['dry_run'] else 'were'} dropped"
+                    ))
+
+        verb = 'would move' if options['dry_run'] else 'moved'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} task(s)"))
+        if stranded_total:
+            self.stdout.write(self.style.WARNING(
+                f"{stranded_total} share(s) with users on other shards "
+                f"{'would be' if options['dry_run'] else 'were'} dropped, sharing works within a shard only"
+            ))
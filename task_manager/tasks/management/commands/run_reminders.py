@@ -0,0 +1,50 @@
+# tasks/management/commands/run_reminders.py
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.reminders import send_due_reminders
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Email due task reminders. Runs once (for cron) or, with --loop, every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='keep running')
+        parser.add_argument('--interval', type=int, default=60, help='seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.run_once(options['batch_size'])
+            if sent:
+                self.stdout.write(f"handled {sent} reminder(s)")
+            if not options['loop']:
+                if failed:
+                    raise CommandError(f"sending reminders failed for {', '.join(failed)}")
+                break
+            # failed reminders stay due (see reminders.py) and are tried again next time
+            time.sleep(options['interval'])
+
+    def run_once(self, batch_size):
+        """(reminders handled, aliases whose batch failed); a failure does not stop the other databases."""
+        total = 0
+        failed = []
+        for using in ['default', *settings.TASK_SHARDS]:
+            # a full batch means there may be more due right now
+            while True:
+                try:
+                    count = send_due_reminders(using, batch_size=batch_size)
+                except Exception:
+                    logger.exception('could not send the due reminders of %s', using)
+                    self.stderr.write(f"{using}: sending reminders failed, retrying on the next run")
+                    failed.append(using)
+                    break
+                total += count
+                if count < batch_size:
+                    break
+        return total, failed
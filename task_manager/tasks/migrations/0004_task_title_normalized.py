@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+from tasks.utils import normalize_title
+
+
+def backfill_title_normalized(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    db = schema_editor.connection.alias
+    batch = []
+    for task in Task.objects.using(db).only('pk', 'title').iterator(chunk_size=2000):
+        task.title_normalized = normalize_title(task.title)
+        batch.append(task)
+        if len(batch) >= 2000:
+            Task.objects.using(db).bulk_update(batch, ['title_normalized'])
+            batch = []
+    Task.objects.using(db).bulk_update(batch, ['title_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_taskarchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='title_normalized',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_title_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'title_normalized'], name='task_owner_title_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_task_title_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['title_normalized'], name='task_title_norm_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_positions(apps, schema_editor):
+    # keep today's order (newest first) as the initial manual order
+    Task = apps.get_model('tasks', 'Task')
+    db = schema_editor.connection.alias
+    batch, owner_id, position = [], None, 0.0
+    for task in Task.objects.using(db).only('pk', 'owner_id').order_by('owner_id', '-created_at', '-pk').iterator(chunk_size=2000):
+        if task.owner_id != owner_id:
+            owner_id, position = task.owner_id, 0.0
+        position += 1.0
+        task.position = position
+        batch.append(task)
+        if len(batch) >= 2000:
+            Task.objects.using(db).bulk_update(batch, ['position'])
+            batch = []
+    Task.objects.using(db).bulk_update(batch, ['position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_task_title_norm_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='position',
+            field=models.FloatField(default=0.0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='taskarchive',
+            name='position',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(backfill_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'position'], name='task_owner_position_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:01
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_task_sharing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Activity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.BigIntegerField(blank=True, null=True)),
+                ('verb', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('status_changed', 'Status changed'), ('favorited', 'Favorited'), ('unfavorited', 'Unfavorited'), ('moved', 'Moved'), ('shared', 'Shared'), ('unshared', 'Unshared'), ('deleted', 'Deleted'), ('profile_updated', 'Profile updated'), ('otp_requested', 'Password reset code requested'), ('password_reset', 'Password reset')], max_length=20)),
+                ('changes', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_id', '-id'], name='activity_task_idx'), models.Index(fields=['actor', '-id'], name='activity_actor_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:02
+
+from django.db import migrations, models
+
+from tasks.utils import normalize_title
+
+
+def backfill_title_normalized(apps, schema_editor):
+    TaskArchive = apps.get_model('tasks', 'TaskArchive')
+    db = schema_editor.connection.alias
+    batch = []
+    for archived in TaskArchive.objects.using(db).only('pk', 'title').iterator(chunk_size=2000):
+        archived.title_normalized = normalize_title(archived.title)
+        batch.append(archived)
+        if len(batch) >= 2000:
+            TaskArchive.objects.using(db).bulk_update(batch, ['title_normalized'])
+            batch = []
+    TaskArchive.objects.using(db).bulk_update(batch, ['title_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_task_subtasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskarchive',
+            name='title_normalized',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_title_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='taskarchive',
+            index=models.Index(fields=['title_normalized'], name='archive_title_norm_idx'),
+        ),
+    ]
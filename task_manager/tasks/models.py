@@ -1,6 +1,41 @@
 # tasks/models.py
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from task_manager.db_router import shard_for_owner
+
+from .utils import normalize_title
+
+
+class TaskQuerySet(models.QuerySet):
+    def for_owner(self, user):
+        """The user's tasks, read from the shard that stores them."""
+        return self.using(shard_for_owner(user.pk) or self._db).filter(owner=user)
+
+    def visible_to(self, user):
+        """
+        Tasks the user owns or was given access to, each annotated with access_role.
+        A single join on the TaskAccess (user, task) index; see sharing.py.
+        """
+        return (
+            self.using(shard_for_owner(user.pk) or self._db)
+            .filter(access__user=user)
+            .annotate(access_role=F('access__role'))
+        )
+
+    def create(self, **kwargs):
+        # QuerySet.create() saves with an explicit alias, so pick the owner's shard here
+        if self._db is None:
+            owner = kwargs.get('owner')
+            alias = shard_for_owner(kwargs.get('owner_id', getattr(owner, 'pk', None)))
+            if alias:
+                return self.using(alias).create(**kwargs)
+        return super().create(**kwargs)
+
 
 class Task(models.Model):
     STATUS_CHOICES = (
@@ -11,14 +46,316 @@ class Task(models.Model):
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=200)
+    # normalize_title(title), kept in sync by save(); backs the suggest prefix lookup
+    title_normalized = models.CharField(max_length=200, default='', editable=False)
     description = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='todo')
     is_favorite = models.BooleanField(default=False)
+    # manual order (?ordering=manual), see ordering.py; new tasks get the top position
+    position = models.FloatField(editable=False)
+    due_at = models.DateTimeField(null=True, blank=True)
+    # pending reminder; run_reminders clears it once sent, so the remind_at index only
+    # holds reminders that are still to go out
+    remind_at = models.DateTimeField(null=True, blank=True)
+    reminded_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # the owner's tags; change them with tags.set_task_tags() so Tag.task_count stays right
+    tags = models.ManyToManyField('Tag', through='TaskTag', related_name='tasks', blank=True)
+    # subtasks, see subtasks.py: path holds the ancestor ids ("12/45/") and is kept by
+    # save(), so a subtree is one prefix scan on the path index
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    path = models.CharField(max_length=255, default='', blank=True, editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # progress of the direct subtasks, moved with atomic increments
+    subtask_count = models.PositiveIntegerField(default=0, editable=False)
+    subtask_done_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    # the counters move with UPDATE ... SET n = n + delta, position under the owner lock
+    # (ordering.py); save() leaves them out of its UPDATE so a task loaded earlier does
+    # not write back stale values
+    MAINTAINED_FIELDS = frozenset({'subtask_count', 'subtask_done_count', 'position'})
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # every hot query is owner scoped and newest first
+            models.Index(fields=['owner', '-created_at'], name='task_owner_created_idx'),
+            # archive_tasks scan
+            models.Index(fields=['status', 'updated_at'], name='task_status_updated_idx'),
+            # suggest: title_normalized LIKE 'prefix%' within one owner
+            models.Index(fields=['owner', 'title_normalized'], name='task_owner_title_norm_idx'),
+            # admin search across all owners
+            models.Index(fields=['title_normalized'], name='task_title_norm_idx'),
+            models.Index(fields=['owner', 'position'], name='task_owner_position_idx'),
+            # ?due= filters
+            models.Index(fields=['owner', 'due_at'], name='task_owner_due_idx'),
+            # run_reminders range scan
+            models.Index(fields=['remind_at'], name='task_remind_at_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def clean(self):
+        # admin forms; the API checks the parent in TaskSerializer.validate_parent()
+        from .subtasks import SubtaskError, check_parent
+
+        if self.parent_id is not None:
+            try:
+                check_parent(self, self.parent)
+            except SubtaskError as exc:
+                raise ValidationError({'parent': str(exc)})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        # the tree fields as stored, save() compares against them (not set for deferred loads)
+        if not {'parent_id', 'path', 'depth', 'status'} - task.__dict__.keys():
+            task._loaded_tree = (task.parent_id, task.path, task.depth, task.status)
+        return task
+
+    def save(self, *args, **kwargs):
+        from . import subtasks
+
+        # shards have their own auto-increment counters, ids come from one sequence instead
+        if self.pk is None and settings.TASK_SHARDS:
+            from .sharding import next_task_id
+            self.pk = next_task_id()
+        using = kwargs.get('using') or router.db_for_write(Task, instance=self)
+        if self.position is None:
+            from .ordering import top_position
+            self.position = top_position(Task, self.owner_id, using)
+        self.title_normalized = normalize_title(self.title)
+        created = self._state.adding
+        loaded = getattr(self, '_loaded_tree', None)
+        if created or loaded is None or loaded[0] != self.parent_id:
+            subtasks.place(self, using)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not created and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.MAINTAINED_FIELDS and f.attname not in deferred
+            ]
+        if update_fields is not None:
+            extra = {'title_normalized'} if 'title' in update_fields else set()
+            if 'parent' in update_fields or 'parent_id' in update_fields:
+                extra |= {'path', 'depth'}
+            kwargs['update_fields'] = {*update_fields, *extra}
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            subtasks.track(self, loaded, created, using)
+
+
+class TaskArchive(models.Model):
+    """
+    Completed tasks moved out of Task by `manage.py archive_tasks`, keeping the Task id.
+    Timestamps are copied, not auto-set. Lives next to Task (same shard).
+    """
+    COPIED_FIELDS = (
+        'id', 'owner_id', 'parent_id', 'path', 'depth', 'title', 'title_normalized', 'description', 'status',
+        'is_favorite', 'position', 'due_at', 'created_at', 'updated_at',
+    )
+
+    id = models.BigIntegerField(primary_key=True)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_tasks')
+    title = models.CharField(max_length=200)
+    # copied from Task; backs the admin title search
+    title_normalized = models.CharField(max_length=200, default='', editable=False)
+    description = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES, default='done')
+    is_favorite = models.BooleanField(default=False)
+    position = models.FloatField(default=0.0)
+    due_at = models.DateTimeField(null=True, blank=True)
+    # place in the tree at archiving time; only tasks without subtasks are archived
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    path = models.CharField(max_length=255, default='', blank=True)
+    depth = models.PositiveSmallIntegerField(default=0)
+    # tag names at archiving time, attached again on restore
+    tags = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='archive_owner_created_idx'),
+            # admin search across all owners
+            models.Index(fields=['title_normalized'], name='archive_title_norm_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(**{f: getattr(task, f) for f in cls.COPIED_FIELDS})
+
+    def restore(self):
+        """
+        Move this row back into Task (same id and timestamps) and return the Task.
+        Access comes back for the owner and list shares; single-task shares were
+        dropped when the task was archived. A subtask goes back under its parent if
+        that still exists, else it becomes a top-level task.
+        """
+        from .sharing import grant_default_access
+        from .subtasks import place, track
+        from .tags import set_task_tags
+        from .utils import insert_rows
+
+        using = self._state.db or 'default'
+        task = Task(**{f: getattr(self, f) for f in self.COPIED_FIELDS})
+        with transaction.atomic(using=using):
+            task.parent = task.parent_id and Task._base_manager.using(using).filter(pk=task.parent_id).first()
+            place(task, using)
+            insert_rows(Task, [task], using=using)
+            track(task, None, True, using)
+            grant_default_access([task], using=using)
+            set_task_tags(task, self.tags, using=using)
+            TaskArchive._base_manager.using(using).filter(pk=self.pk).delete()
+        task._state.adding = False
+        task._state.db = using
+        return task
+
+
+class Tag(models.Model):
+    """A user's label for their tasks. task_count is kept by tags.py with atomic increments."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+    # normalize_title(name): tags match case- and accent-insensitively
+    normalized = models.CharField(max_length=50, editable=False)
+    task_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'normalized'], name='tag_owner_normalized_uniq'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TaskTag(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='task_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='task_tags')
+
+    class Meta:
+        constraints = [
+            # also serves prefetching and ?tag= lookups by task
+            models.UniqueConstraint(fields=['task', 'tag'], name='task_tag_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'task'], name='task_tag_tag_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task_id} {self.tag_id}'
+
+
+class TaskAccess(models.Model):
+    """
+    Materialized ACL: one row per task and user who can see it, the owner included,
+    so listing and permission checks never have to work out sharing at read time.
+    Rows granted by a ListShare carry via_list and go away with it. Lives next to
+    its task (same shard).
+    """
+    OWNER, EDITOR, VIEWER = 'owner', 'editor', 'viewer'
+    ROLE_CHOICES = (
+        (OWNER, 'Owner'),
+        (EDITOR, 'Editor'),
+        (VIEWER, 'Viewer'),
+    )
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='access')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='task_access')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    via_list = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Task.objects.visible_to() join and object permission lookups
+            models.UniqueConstraint(fields=['user', 'task'], name='task_access_user_task_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.role} {self.task_id}'
+
+
+class ListShare(models.Model):
+    """All of an owner's tasks, current and future, shared with another user (owner's shard)."""
+    ROLE_CHOICES = TaskAccess.ROLE_CHOICES[1:]
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='list_shares')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'user'], name='list_share_owner_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.owner_id} -> {self.user_id} ({self.role})'
+
+
+class Activity(models.Model):
+    """
+    Append-only audit trail of task and account changes, buffered and written in
+    batches by activity.py. Always stored in 'default'; task_id is not a foreign key
+    so entries outlive deleted and archived tasks and work for any shard.
+    """
+    VERB_CHOICES = (
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('status_changed', 'Status changed'),
+        ('favorited', 'Favorited'),
+        ('unfavorited', 'Unfavorited'),
+        ('moved', 'Moved'),
+        ('shared', 'Shared'),
+        ('unshared', 'Unshared'),
+        ('deleted', 'Deleted'),
+        ('profile_updated', 'Profile updated'),
+        ('otp_requested', 'Password reset code requested'),
+        ('password_reset', 'Password reset'),
+    )
+
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    task_id = models.BigIntegerField(null=True, blank=True)
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES)
+    # {field: [old, new]} for updates, other details otherwise
+    changes = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # when it happened, not when the buffer was flushed
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # /api/tasks/<id>/activity/ keyset pages, newest first
+            models.Index(fields=['task_id', '-id'], name='activity_task_idx'),
+            models.Index(fields=['actor', '-id'], name='activity_actor_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.verb} {self.task_id or ""}'.strip()
+
+
+class IdSequence(models.Model):
+    """Global id counter (lives in 'default') handed out in blocks, see sharding.next_task_id."""
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.last_value}'
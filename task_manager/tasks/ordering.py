@@ -0,0 +1,64 @@
+# tasks/ordering.py
+"""
+Manual task order. Each task has a float `position`; a moved task gets the midpoint
+of its new neighbours, so a move updates a single row. New tasks go on top
+(smallest position - 1). Once neighbours get closer than MIN_POSITION_GAP the
+owner's positions are renumbered 1, 2, 3... in the same transaction.
+
+Moves and renumbering of one owner hold a row lock on the owner (lock_owner), so a
+move never writes a midpoint computed from positions a renumbering has replaced.
+Only those two write the position of an existing task; Task.save() leaves it out.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Min
+
+MIN_POSITION_GAP = 1e-6
+REBALANCE_BATCH_SIZE = 1000
+
+
+def top_position(model, owner_id, using):
+    """Position that puts a new task above all of the owner's tasks (index lookup)."""
+    current = model._base_manager.using(using).filter(owner_id=owner_id).aggregate(m=Min('position'))['m']
+    return 0.0 if current is None else current - 1.0
+
+
+def position_between(lower, upper):
+    """Position between two neighbours' positions (None = list start/end), None if no room."""
+    if lower is None and upper is None:
+        return 0.0
+    if lower is None:
+        return upper - 1.0
+    if upper is None:
+        return lower + 1.0
+    middle = (lower + upper) / 2
+    return middle if lower < middle < upper else None
+
+
+def needs_rebalance(lower, upper):
+    return lower is not None and upper is not None and upper - lower < MIN_POSITION_GAP
+
+
+def lock_owner(owner_id, using):
+    """
+    Serialize position changes of one owner until the transaction ends: SELECT ...
+    FOR UPDATE on the owner's user row (users are copied into every shard).
+    """
+    User = get_user_model()
+    list(User._base_manager.using(using).select_for_update().filter(pk=owner_id).values_list('pk'))
+
+
+def rebalance_positions(model, owner_id, using):
+    """Renumber the owner's tasks 1..n in their current order."""
+    with transaction.atomic(using=using):
+        lock_owner(owner_id, using)
+        _renumber(model, owner_id, using)
+
+
+def _renumber(model, owner_id, using):
+    pks = list(
+        model._base_manager.using(using).filter(owner_id=owner_id)
+        .order_by('position', 'pk').values_list('pk', flat=True)
+    )
+    rows = [model(pk=pk, position=float(i)) for i, pk in enumerate(pks, start=1)]
+    model._base_manager.using(using).bulk_update(rows, ['position'], batch_size=REBALANCE_BATCH_SIZE)
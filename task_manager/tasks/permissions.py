@@ -1,17 +1,31 @@
 # tasks/permissions.py
 from rest_framework import permissions
 
-class IsOwnerOrReadOnly(permissions.BasePermission):
+from .models import TaskAccess
+
+
+class HasTaskAccess(permissions.BasePermission):
     """
-    Allow only owners to edit/delete. Authenticated users may read.
+    Object access from the caller's role in TaskAccess (see sharing.py): viewers
+    read, editors also edit, only the owner deletes, reorders and shares.
     """
+    OWNER_ONLY_ACTIONS = ('destroy', 'move', 'access')
 
     def has_permission(self, request, view):
-        # require authentication for any access (you can make list/create allowed for authenticated only)
+        # require authentication for any access
         return request.user and request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        # SAFE methods allowed (GET, HEAD, OPTIONS) for authenticated users
-        if request.method in permissions.SAFE_METHODS:
+        # tasks from Task.objects.visible_to() carry the role, so this costs no query;
+        # archived tasks are only ever loaded for their owner
+        role = getattr(obj, 'access_role', None)
+        if role is None and obj.owner_id == request.user.pk:
+            role = TaskAccess.OWNER
+        if role is None:
+            return False
+        if role == TaskAccess.OWNER:
             return True
-        return obj.owner == request.user
+        # owner-only actions include reads (the collaborator list of /access/)
+        if view.action in self.OWNER_ONLY_ACTIONS:
+            return False
+        return request.method in permissions.SAFE_METHODS or role == TaskAccess.EDITOR
@@ -0,0 +1,96 @@
+# tasks/reminders.py
+"""
+Reminder delivery for run_reminders.
+
+Due reminders are read as a range scan on the remind_at index (sent reminders have
+remind_at cleared, so the scan never wades through old rows) and claimed so that
+several schedulers can run at once:
+
+- databases with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8, PostgreSQL): rows are
+  locked, mailed and cleared in one transaction; a failed send rolls back and the
+  reminders are picked up again on the next run.
+- others (SQLite): each row is claimed with a conditional UPDATE on its remind_at
+  value, and claims whose mail could not be sent are put back.
+
+Every owner gets one email for all their due tasks, all sent over one connection.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Task
+
+
+def _due(using, now):
+    return (
+        Task._base_manager.using(using)
+        .filter(remind_at__lte=now)
+        .order_by('remind_at')
+        .only('pk', 'owner_id', 'title', 'status', 'due_at', 'remind_at')
+    )
+
+
+def _build_messages(tasks):
+    owners = get_user_model()._base_manager.using('default').in_bulk({t.owner_id for t in tasks})
+    by_owner = {}
+    for task in tasks:
+        # reminders of tasks completed in the meantime are just cleared
+        if task.status != 'done' and task.owner_id in owners:
+            by_owner.setdefault(task.owner_id, []).append(task)
+
+    messages = []
+    for owner_id, owner_tasks in by_owner.items():
+        user = owners[owner_id]
+        lines = []
+        for task in owner_tasks:
+            due = f" (due {timezone.localtime(task.due_at):%Y-%m-%d %H:%M})" if task.due_at else ""
+            lines.append(f"- {task.title}{due}")
+        subject = f"Reminder: {len(owner_tasks)} task(s) need your attention"
+        body = (
+            f"Hello {user.get_short_name() or user.username},\n\n"
+            + "\n".join(lines)
+            + "\n\n— Secure Task Manager"
+        )
+        messages.append(mail.EmailMessage(subject, body, settings.EMAIL_HOST_USER, [user.email]))
+    return messages
+
+
+def _send(messages):
+    if not messages:
+        return
+    connection = mail.get_connection()
+    # one SMTP session for the whole batch
+    connection.send_messages(messages)
+
+
+def send_due_reminders(using='default', batch_size=100, now=None):
+    """Send one batch of due reminders from database `using`. Returns the number of tasks handled."""
+    now = now or timezone.now()
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            tasks = list(_due(using, now).select_for_update(skip_locked=True, of=('self',))[:batch_size])
+            if tasks:
+                _send(_build_messages(tasks))
+                Task._base_manager.using(using).filter(pk__in=[t.pk for t in tasks]).update(
+                    remind_at=None, reminded_at=now,
+                )
+        return len(tasks)
+
+    claimed = []
+    for task in _due(using, now)[:batch_size]:
+        # only one scheduler can move remind_at away from the value it read
+        if Task._base_manager.using(using).filter(pk=task.pk, remind_at=task.remind_at).update(
+            remind_at=None, reminded_at=now,
+        ):
+            claimed.append(task)
+    try:
+        _send(_build_messages(claimed))
+    except Exception:
+        for task in claimed:
+            Task._base_manager.using(using).filter(pk=task.pk, remind_at__isnull=True).update(
+                remind_at=task.remind_at, reminded_at=None,
+            )
+        raise
+    return len(claimed)
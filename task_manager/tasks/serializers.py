@@ -1,16 +1,118 @@
 # tasks/serializers.py
 from rest_framework import serializers
-from .models import Task
+from .models import Activity, ListShare, Task, TaskAccess
+from .subtasks import SubtaskError, check_parent
+from .tags import MAX_TAG_LENGTH, MAX_TAGS_PER_TASK, set_task_tags
+
+
+class TagListField(serializers.ListField):
+    """Tag names; reads prefetched Task.tags, or the names stored on an archived task."""
+    child = serializers.CharField(max_length=MAX_TAG_LENGTH)
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_length', MAX_TAGS_PER_TASK)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if hasattr(value, 'all'):
+            return [tag.name for tag in value.all()]
+        return list(value)
+
 
 class TaskSerializer(serializers.ModelSerializer):
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     owner_email = serializers.CharField(source='owner.email', read_only=True)
+    # the caller's role, annotated by Task.objects.visible_to(); own and archived tasks are 'owner'
+    access_role = serializers.SerializerMethodField()
+    tags = TagListField(required=False)
+    # parent task id; checked against what the caller may edit, see validate_parent()
+    parent = serializers.IntegerField(source='parent_id', required=False, allow_null=True)
+    # progress of the direct subtasks; archived tasks have none
+    subtask_count = serializers.IntegerField(read_only=True, default=0)
+    subtask_done_count = serializers.IntegerField(read_only=True, default=0)
 
     class Meta:
         model = Task
         fields = [
-            'id', 'owner', 'owner_username', 'owner_email',
-            'title', 'description', 'status', 'is_favorite',
+            'id', 'owner', 'owner_username', 'owner_email', 'access_role',
+            'title', 'description', 'status', 'is_favorite', 'tags', 'position',
+            'due_at', 'remind_at', 'reminded_at',
+            'parent', 'depth', 'subtask_count', 'subtask_done_count',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ('owner', 'created_at', 'updated_at')
+        read_only_fields = ('owner', 'position', 'reminded_at', 'depth', 'created_at', 'updated_at')
+
+    def get_access_role(self, obj):
+        return getattr(obj, 'access_role', TaskAccess.OWNER)
+
+    def validate_parent(self, value):
+        """The parent has to be a task the caller can edit; it is kept in self.parent_task."""
+        self.parent_task = None
+        if value is None:
+            return value
+        parent = Task.objects.visible_to(self.context['request'].user).select_related('owner').filter(pk=value).first()
+        if parent is None:
+            raise serializers.ValidationError('No such task.')
+        if parent.access_role == TaskAccess.VIEWER:
+            raise serializers.ValidationError('You cannot add subtasks to this task.')
+        try:
+            check_parent(self.instance or Task(owner_id=parent.owner_id), parent)
+        except SubtaskError as exc:
+            raise serializers.ValidationError(str(exc))
+        self.parent_task = parent
+        return value
+
+    def use_parent_task(self, validated_data):
+        # the loaded parent, so Task.save() does not read it again
+        if 'parent_id' in validated_data:
+            validated_data['parent'] = validated_data.pop('parent_id') and self.parent_task
+
+    def create(self, validated_data):
+        tags = validated_data.pop('tags', None)
+        self.use_parent_task(validated_data)
+        task = super().create(validated_data)
+        if tags:
+            set_task_tags(task, tags)
+        return task
+
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        self.use_parent_task(validated_data)
+        task = super().update(instance, validated_data)
+        if tags is not None:
+            set_task_tags(task, tags)
+        return task
+
+
+class TaskAccessSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    email = serializers.CharField(source='user.email', read_only=True)
+
+    class Meta:
+        model = TaskAccess
+        fields = ['user', 'username', 'email', 'role', 'via_list', 'created_at']
+        read_only_fields = fields
+
+
+class ListShareSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    email = serializers.CharField(source='user.email', read_only=True)
+
+    class Meta:
+        model = ListShare
+        fields = ['user', 'username', 'email', 'role', 'created_at']
+        read_only_fields = fields
+
+
+class ActivitySerializer(serializers.ModelSerializer):
+    actor_username = serializers.CharField(source='actor.username', read_only=True, default=None)
+
+    class Meta:
+        model = Activity
+        fields = ['id', 'actor', 'actor_username', 'task_id', 'verb', 'changes', 'created_at']
+        read_only_fields = fields
+
+
+class TagSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    count = serializers.IntegerField()
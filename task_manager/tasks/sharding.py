@@ -0,0 +1,183 @@
+# tasks/sharding.py
+"""
+Owner sharding helpers. Only active when settings.TASK_SHARDS is non-empty.
+
+- Task ids come from an IdSequence row in 'default', reserved ID_BLOCK_SIZE at a
+  time per process, so rows keep their id when they move between shards.
+- Users stay in 'default' and are copied to every shard so the owner foreign key
+  (and owner joins) work inside a shard.
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from task_manager.db_router import shard_for_owner
+
+from .models import IdSequence, ListShare, Tag, Task, TaskAccess, TaskArchive, TaskTag
+from .tags import recount_tags
+from .utils import insert_rows
+
+ID_BLOCK_SIZE = 100
+TASK_SEQUENCE = 'tasks.task'
+
+_id_lock = threading.Lock()
+_id_block = {'next': 0, 'end': 0}
+
+
+def _reserve_ids(size):
+    with transaction.atomic(using='default'):
+        seq = IdSequence.objects.using('default').select_for_update().filter(name=TASK_SEQUENCE).first()
+        if seq is None:
+            # first sharded write: continue after whatever ids already exist anywhere
+            existing = [
+                Task._base_manager.using(alias).aggregate(m=Max('pk'))['m'] or 0
+                for alias in ['default', *settings.TASK_SHARDS]
+            ]
+            seq = IdSequence.objects.using('default').create(name=TASK_SEQUENCE, last_value=max(existing))
+        start = seq.last_value + 1
+        seq.last_value += size
+        seq.save(using='default', update_fields=['last_value'])
+    return start
+
+
+def next_task_id():
+    with _id_lock:
+        if _id_block['next'] >= _id_block['end']:
+            start = _reserve_ids(ID_BLOCK_SIZE)
+            _id_block['next'], _id_block['end'] = start, start + ID_BLOCK_SIZE
+        value = _id_block['next']
+        _id_block['next'] += 1
+    return value
+
+
+def replicate_user(user, shards=None):
+    """Copy (insert or update) a user row into the given shards, all shards by default."""
+    User = type(user)
+    values = {
+        f.attname: f.value_from_object(user)
+        for f in User._meta.concrete_fields if not f.primary_key
+    }
+    for alias in shards or settings.TASK_SHARDS:
+        # queryset update/bulk_create: no signals, so no replication loop
+        if not User._base_manager.using(alias).filter(pk=user.pk).update(**values):
+            User._base_manager.using(alias).bulk_create([User(pk=user.pk, **values)])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_user_to_shards(sender, instance, using, **kwargs):
+    if settings.TASK_SHARDS and using not in settings.TASK_SHARDS:
+        replicate_user(instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_from_shards(sender, instance, using, **kwargs):
+    if settings.TASK_SHARDS and using not in settings.TASK_SHARDS:
+        for alias in settings.TASK_SHARDS:
+            # cascades to the user's tasks in that shard
+            get_user_model()._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def stranded_collaborators(owner_id, source):
+    """
+    Ids of users the owner's tasks in `source` are shared with who are stored on
+    another shard than the owner's. Sharing works within a shard only, so their
+    access cannot follow the tasks.
+    """
+    target = shard_for_owner(owner_id)
+    user_ids = set(ListShare._base_manager.using(source).filter(owner_id=owner_id).values_list('user_id', flat=True))
+    user_ids.update(
+        TaskAccess._base_manager.using(source).filter(task__owner_id=owner_id)
+        .exclude(user_id=owner_id).order_by().values_list('user_id', flat=True).distinct()
+    )
+    return sorted(user_id for user_id in user_ids if shard_for_owner(user_id) != target)
+
+
+def move_owner_tasks(owner_id, source, batch_size=500):
+    """
+    Move one owner's tasks and archived tasks from `source` to the shard they belong
+    in, in batches, with their access rows, tags and the owner's list shares. Copy
+    first, delete after, so an interrupted run can simply be repeated.
+
+    Returns (tasks moved, archived ones included; ids of the users who lost access):
+    shares with users of another shard are not copied, see stranded_collaborators().
+    """
+    target = shard_for_owner(owner_id)
+    if target is None or target == source:
+        return 0, []
+    User = get_user_model()
+    replicate_user(User._base_manager.using('default').get(pk=owner_id), [target])
+    stranded = stranded_collaborators(owner_id, source)
+
+    # access rows get fresh pks in the target, (owner, user) and (user, task) are unique
+    shares = ListShare._base_manager.using(source).filter(owner_id=owner_id)
+    ListShare._base_manager.using(target).bulk_create(
+        [
+            ListShare(owner_id=owner_id, user_id=s.user_id, role=s.role)
+            for s in shares.exclude(user_id__in=stranded)
+        ],
+        ignore_conflicts=True,
+    )
+    tags = Tag._base_manager.using(source).filter(owner_id=owner_id)
+    Tag._base_manager.using(target).bulk_create(
+        [Tag(owner_id=owner_id, name=t.name, normalized=t.normalized) for t in tags], ignore_conflicts=True,
+    )
+    tag_ids = dict(Tag._base_manager.using(target).filter(owner_id=owner_id).values_list('normalized', 'pk'))
+    tasks = Task._base_manager.using(source).filter(owner_id=owner_id)
+    moved = 0
+    last_depth, last_pk = -1, 0
+    # parents before their subtasks, so the parent foreign key holds in the target
+    while True:
+        batch = list(
+            tasks.filter(Q(depth__gt=last_depth) | Q(depth=last_depth, pk__gt=last_pk))
+            .order_by('depth', 'pk')[:batch_size]
+        )
+        if not batch:
+            break
+        pks = [t.pk for t in batch]
+        insert_rows(Task, batch, using=target, ignore_conflicts=True)
+        TaskAccess._base_manager.using(target).bulk_create(
+            [
+                TaskAccess(task_id=a.task_id, user_id=a.user_id, role=a.role, via_list=a.via_list)
+                for a in TaskAccess._base_manager.using(source).filter(task_id__in=pks).exclude(user_id__in=stranded)
+            ],
+            ignore_conflicts=True,
+        )
+        TaskTag._base_manager.using(target).bulk_create(
+            [
+                TaskTag(task_id=link.task_id, tag_id=tag_ids[link.tag.normalized])
+                for link in TaskTag._base_manager.using(source).filter(task_id__in=pks).select_related('tag')
+            ],
+            ignore_conflicts=True,
+        )
+        moved += len(batch)
+        last_depth, last_pk = batch[-1].depth, batch[-1].pk
+    recount_tags(owner_id, target)
+    # TaskArchive.objects.for_owner() reads the owner's shard too
+    archive = TaskArchive._base_manager.using(source).filter(owner_id=owner_id)
+    last_pk = 0
+    while True:
+        batch = list(archive.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        insert_rows(TaskArchive, batch, using=target, ignore_conflicts=True)
+        moved += len(batch)
+        last_pk = batch[-1].pk
+    # leaves first, so deleting a batch never cascades into rows that are still to go
+    while True:
+        pks = list(tasks.order_by('-depth', 'pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        tasks.filter(pk__in=pks).delete()
+    while True:
+        pks = list(archive.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        archive.filter(pk__in=pks).delete()
+    shares.delete()
+    tags.delete()
+    return moved, stranded
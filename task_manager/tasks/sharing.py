@@ -0,0 +1,134 @@
+"""
+Task sharing. Who may see a task is materialized in TaskAccess, the owner
+included, so that:
+
+- listing is one join (Task.objects.visible_to), and
+- object permissions read the access_role annotation of the loaded row, with no
+  extra queries however many collaborators a task has.
+
+Rows are written when access changes: on task creation (owner, list shares and,
+for a subtask, the single-task shares of its parent), by share_task/unshare_task for
+a task and its subtasks, and by share_list/unshare_list for all of an owner's
+tasks. With sharded tasks, access rows live next to the task, so sharing only
+works between users of the same shard.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from task_manager.db_router import shard_for_owner
+
+from .models import ListShare, Task, TaskAccess
+from .subtasks import descendants, subtree_prefix
+
+GRANT_BATCH_SIZE = 1000
+
+
+class SharingError(ValueError):
+    pass
+
+
+def check_same_shard(owner_id, user_id):
+    if shard_for_owner(owner_id) != shard_for_owner(user_id):
+        raise SharingError('Tasks cannot be shared with users stored on another shard.')
+
+
+def grant_default_access(tasks, using):
+    """Owner access, the owner's list shares and the parent's task shares for freshly inserted tasks."""
+    if not tasks:
+        return
+    shares = {}
+    for share in ListShare.objects.using(using).filter(owner_id__in={t.owner_id for t in tasks}):
+        shares.setdefault(share.owner_id, []).append(share)
+    inherited = {}
+    parent_ids = {t.parent_id for t in tasks if t.parent_id}
+    if parent_ids:
+        for access in TaskAccess.objects.using(using).filter(
+            task_id__in=parent_ids, via_list=False,
+        ).exclude(role=TaskAccess.OWNER):
+            inherited.setdefault(access.task_id, []).append(access)
+    rows = []
+    for task in tasks:
+        rows.append(TaskAccess(task_id=task.pk, user_id=task.owner_id, role=TaskAccess.OWNER))
+        rows.extend(
+            TaskAccess(task_id=task.pk, user_id=access.user_id, role=access.role)
+            for access in inherited.get(task.parent_id, ())
+        )
+        rows.extend(
+            TaskAccess(task_id=task.pk, user_id=share.user_id, role=share.role, via_list=True)
+            for share in shares.get(task.owner_id, ())
+        )
+    TaskAccess.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Task)
+def grant_access_on_create(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw:
+        grant_default_access([instance], using)
+
+
+def in_subtree(task):
+    # access rows of task and its subtasks (prefix scan on the subtask path)
+    return Q(task_id=task.pk) | Q(task__path__istartswith=subtree_prefix(task))
+
+
+def share_task(task, user, role):
+    """
+    Give user role on a task and its subtasks; replaces roles that came from a
+    list share. Subtasks created later inherit it in grant_default_access().
+    """
+    if user.pk == task.owner_id:
+        raise SharingError('The owner already has full access.')
+    check_same_shard(task.owner_id, user.pk)
+    using = task._state.db
+    with transaction.atomic(using=using):
+        # the tree has a single owner, so none of these rows is an owner row
+        TaskAccess.objects.using(using).filter(in_subtree(task), user=user).update(role=role, via_list=False)
+        task_ids = [task.pk, *descendants(Task._base_manager.using(using), task).values_list('pk', flat=True)]
+        TaskAccess.objects.using(using).bulk_create(
+            [TaskAccess(task_id=pk, user=user, role=role) for pk in task_ids],
+            batch_size=GRANT_BATCH_SIZE, ignore_conflicts=True,
+        )
+    return TaskAccess.objects.using(using).get(task_id=task.pk, user=user)
+
+
+def unshare_task(task, user):
+    """Take the user's access to a task and its subtasks away; returns the number of rows removed."""
+    return TaskAccess.objects.using(task._state.db).filter(
+        in_subtree(task), user=user,
+    ).exclude(role=TaskAccess.OWNER).delete()[0]
+
+
+def share_list(owner, user, role, batch_size=GRANT_BATCH_SIZE):
+    """Share all of owner's tasks with user, including tasks created later."""
+    if user.pk == owner.pk:
+        raise SharingError('The owner already has full access.')
+    check_same_shard(owner.pk, user.pk)
+    tasks = Task.objects.for_owner(owner)
+    using = tasks.db
+    with transaction.atomic(using=using):
+        share, _ = ListShare.objects.using(using).update_or_create(
+            owner=owner, user=user, defaults={'role': role},
+        )
+        # role change of an existing list share
+        TaskAccess.objects.using(using).filter(user=user, via_list=True, task__owner=owner).update(role=role)
+    # grant in batches of pks (owner index), existing single-task shares are kept
+    last_pk = 0
+    while True:
+        pks = list(tasks.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return share
+        TaskAccess.objects.using(using).bulk_create(
+            [TaskAccess(task_id=pk, user=user, role=role, via_list=True) for pk in pks],
+            ignore_conflicts=True,
+        )
+        last_pk = pks[-1]
+
+
+def unshare_list(owner, user):
+    using = Task.objects.for_owner(owner).db
+    with transaction.atomic(using=using):
+        deleted, _ = ListShare.objects.using(using).filter(owner=owner, user=user).delete()
+        TaskAccess.objects.using(using).filter(user=user, via_list=True, task__owner=owner).delete()
+    return deleted
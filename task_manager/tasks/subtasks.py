@@ -0,0 +1,145 @@
+"""
+Subtasks. A task's place in its tree is stored twice:
+
+- parent, the adjacency link, and
+- path, the ids of its ancestors root first ("12/45/"), with depth = number of
+  ancestors.
+
+A whole subtree is then one indexed prefix scan (path LIKE '12/45/7/%'), at any
+depth, and moving a subtree rewrites the descendants' paths with one UPDATE.
+Prefix lookups use istartswith: on MySQL startswith is LIKE BINARY, which does not
+range-scan the path index (paths are digits and slashes, so case never matters).
+
+Parents carry subtask_count / subtask_done_count for their direct children.
+Task.save() keeps them right on create, status change and re-parenting; deletes
+and archiving go through delete_subtree() and detach(). Counters move with
+UPDATE ... SET n = n + delta, like the tag counters.
+
+Subtasks belong to the owner of their tree, so a tree never spans shards.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Max, Value
+from django.db.models.functions import Concat, Substr
+
+from .models import Task
+from .tags import release_tags
+
+# path is a varchar(255); 20 levels of 10-digit ids still fit
+MAX_DEPTH = 20
+
+
+class SubtaskError(ValueError):
+    pass
+
+
+def subtree_prefix(task):
+    """Path prefix shared by all descendants of task."""
+    return f'{task.path}{task.pk}/'
+
+
+def descendants(queryset, task, depth=None):
+    """Descendants of task in queryset, at most `depth` levels below it."""
+    queryset = queryset.filter(path__istartswith=subtree_prefix(task))
+    if depth is not None:
+        queryset = queryset.filter(depth__lte=task.depth + depth)
+    return queryset
+
+
+def check_parent(task, parent):
+    """Raise SubtaskError if task may not go under parent."""
+    if parent.owner_id != task.owner_id:
+        raise SubtaskError('Subtasks belong to the owner of their parent task.')
+    if task.pk is not None and (parent.pk == task.pk or parent.path.startswith(subtree_prefix(task))):
+        raise SubtaskError('A task cannot be moved under itself or one of its subtasks.')
+    if parent.depth + 1 > MAX_DEPTH:
+        raise SubtaskError(f'Subtasks can be nested at most {MAX_DEPTH} levels deep.')
+
+
+def place(task, using):
+    """Set path and depth from the parent; called by Task.save() before a (re)insert."""
+    if task.parent_id is None:
+        task.path, task.depth = '', 0
+        return
+    parent = task.parent if Task.parent.is_cached(task) else (
+        Task._base_manager.using(using).only('pk', 'owner_id', 'path', 'depth').get(pk=task.parent_id)
+    )
+    check_parent(task, parent)
+    if task.pk is not None and task.path != parent.path + f'{parent.pk}/':
+        # the subtree has to fit below the new parent as well
+        deepest = Task._base_manager.using(using).filter(
+            path__istartswith=subtree_prefix(task),
+        ).aggregate(depth=Max('depth'))['depth']
+        if deepest is not None and deepest - task.depth + parent.depth + 1 > MAX_DEPTH:
+            raise SubtaskError(f'Subtasks can be nested at most {MAX_DEPTH} levels deep.')
+    task.path = f'{parent.path}{parent.pk}/'
+    task.depth = parent.depth + 1
+
+
+def _adjust_progress(deltas, using):
+    # deltas: {parent_id: (count delta, done delta)}; one UPDATE per distinct delta pair
+    by_delta = defaultdict(list)
+    for parent_id, delta in deltas.items():
+        if parent_id is not None and any(delta):
+            by_delta[delta].append(parent_id)
+    for (count, done), parent_ids in by_delta.items():
+        Task._base_manager.using(using).filter(pk__in=parent_ids).update(
+            subtask_count=F('subtask_count') + count,
+            subtask_done_count=F('subtask_done_count') + done,
+        )
+
+
+def track(task, loaded, created, using):
+    """
+    After Task.save(): move the parents' counters and, when the task changed
+    parent, its descendants' paths. loaded is (parent_id, path, depth, status)
+    as read from the database, None if unknown.
+    """
+    done = int(task.status == 'done')
+    if created:
+        _adjust_progress({task.parent_id: (1, done)}, using)
+    elif loaded is not None:
+        old_parent_id, old_path, old_depth, old_status = loaded
+        old_done = int(old_status == 'done')
+        if old_parent_id != task.parent_id:
+            deltas = defaultdict(lambda: (0, 0))
+            deltas[old_parent_id] = (-1, -old_done)
+            count, done_delta = deltas[task.parent_id]
+            deltas[task.parent_id] = (count + 1, done_delta + done)
+            _adjust_progress(deltas, using)
+        elif old_done != done:
+            _adjust_progress({task.parent_id: (0, done - old_done)}, using)
+        if old_path != task.path:
+            old_prefix = f'{old_path}{task.pk}/'
+            Task._base_manager.using(using).filter(path__istartswith=old_prefix).update(
+                path=Concat(Value(subtree_prefix(task)), Substr('path', len(old_prefix) + 1)),
+                depth=F('depth') + (task.depth - old_depth),
+            )
+    task._loaded_tree = (task.parent_id, task.path, task.depth, task.status)
+
+
+def detach(tasks, using):
+    """
+    Take tasks that are about to be deleted or archived out of their parents'
+    counters. Call inside the transaction that removes them.
+    """
+    deltas = defaultdict(lambda: (0, 0))
+    for task in tasks:
+        count, done = deltas[task.parent_id]
+        deltas[task.parent_id] = (count - 1, done - int(task.status == 'done'))
+    _adjust_progress(deltas, using)
+
+
+def delete_subtree(task):
+    """Delete task and all its subtasks in a constant number of queries; returns the deleted ids."""
+    using = task._state.db
+    tasks = Task._base_manager.using(using)
+    with transaction.atomic(using=using):
+        ids = [task.pk, *descendants(tasks, task).values_list('pk', flat=True)]
+        release_tags(ids, using)
+        detach([task], using)
+        # all of the subtree at once, so the cascade does not walk it level by level
+        tasks.filter(pk__in=ids).delete()
+    return ids
+
@@ -0,0 +1,70 @@
+# tasks/suggest.py
+"""
+Title prefix suggestions for the nav search box.
+
+Each user keeps a small LRU of their recent prefixes in the cache. A prefix is
+answered from the LRU when it was asked before, or when a shorter prefix returned
+fewer rows than its limit (then the longer prefix's rows are a subset of those).
+The entry is dropped whenever one of the user's tasks changes.
+"""
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Task, TaskArchive
+from .utils import normalize_title
+
+SUGGEST_LRU_SIZE = 20
+SUGGEST_CACHE_TIMEOUT = 300
+
+
+def _cache_key(user_id):
+    return f'tasks:suggest:{user_id}'
+
+
+def _from_lru(lru, prefix, limit):
+    hit = lru.get(prefix)
+    if hit is not None and (hit[0] >= limit or len(hit[1]) < hit[0]):
+        return hit[1][:limit]
+    for end in range(len(prefix) - 1, 0, -1):
+        hit = lru.get(prefix[:end])
+        # only a complete (not truncated) shorter result contains every match
+        if hit is not None and len(hit[1]) < hit[0]:
+            return [row for row in hit[1] if row[2].startswith(prefix)][:limit]
+    return None
+
+
+def suggest_titles(user, prefix, limit):
+    """Up to `limit` (id, title) pairs of the user's tasks whose title starts with prefix."""
+    prefix = normalize_title(prefix)
+    if not prefix:
+        return []
+
+    key = _cache_key(user.pk)
+    lru = cache.get(key) or OrderedDict()
+    rows = _from_lru(lru, prefix, limit)
+    if rows is None:
+        # range scan on the (owner, title_normalized) index. istartswith: on MySQL
+        # startswith is LIKE BINARY, which cannot use the case-insensitive index;
+        # title_normalized and prefix are lowercase already, so the matches are the same
+        rows = list(
+            Task.objects.for_owner(user)
+            .filter(title_normalized__istartswith=prefix)
+            .order_by('title_normalized', 'pk')
+            .values_list('pk', 'title', 'title_normalized')[:limit]
+        )
+    lru[prefix] = (limit, rows)
+    lru.move_to_end(prefix)
+    while len(lru) > SUGGEST_LRU_SIZE:
+        lru.popitem(last=False)
+    cache.set(key, lru, SUGGEST_CACHE_TIMEOUT)
+    return [(pk, title) for pk, title, _ in rows]
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskArchive)
+def invalidate_suggestions(sender, instance, **kwargs):
+    cache.delete(_cache_key(instance.owner_id))
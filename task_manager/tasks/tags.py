@@ -0,0 +1,117 @@
+"""
+Task tags. Every change of a task's tags goes through set_task_tags() or
+release_tags(), which keep Tag.task_count (tasks carrying the tag, archived
+ones excluded) in step. Tasks are deleted with subtasks.delete_subtree(), from the
+API and the admin alike, which releases their tags first. Counters:
+
+- counters move with UPDATE ... SET task_count = task_count + n, never with a
+  read-modify-write, and
+- the tasks involved are locked (SELECT ... FOR UPDATE) while their links are
+  read and changed, so concurrent edits of one task apply one after the other.
+"""
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.db.models import Count, F
+
+from .models import Tag, Task, TaskTag
+from .utils import normalize_title
+
+MAX_TAGS_PER_TASK = 20
+MAX_TAG_LENGTH = 50
+
+
+def clean_tag_names(names):
+    """{normalized: display name} for the given names, blanks and duplicates dropped."""
+    cleaned = {}
+    for name in names or ():
+        name = ' '.join(str(name).split())[:MAX_TAG_LENGTH]
+        key = normalize_title(name)[:MAX_TAG_LENGTH]
+        if key:
+            cleaned.setdefault(key, name)
+    return cleaned
+
+
+def get_or_create_tags(owner_id, names, using):
+    """Tags of owner_id for {normalized: name}, creating the missing ones."""
+    if not names:
+        return []
+    tags = Tag.objects.using(using).filter(owner_id=owner_id, normalized__in=names)
+    missing = set(names) - {t.normalized for t in tags}
+    if not missing:
+        return list(tags)
+    # a concurrent request may create the same tag, the unique constraint keeps one
+    Tag.objects.using(using).bulk_create(
+        [Tag(owner_id=owner_id, name=names[key], normalized=key) for key in missing],
+        ignore_conflicts=True,
+    )
+    return list(tags.all())
+
+
+def _adjust_counts(deltas, using):
+    # one UPDATE per distinct delta, usually just +1 and/or -1
+    by_delta = defaultdict(list)
+    for tag_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(tag_id)
+    for delta, tag_ids in by_delta.items():
+        Tag.objects.using(using).filter(pk__in=tag_ids).update(task_count=F('task_count') + delta)
+
+
+def _lock_tasks(task_ids, using):
+    list(Task._base_manager.using(using).select_for_update().filter(pk__in=task_ids).values_list('pk'))
+
+
+def set_task_tags(task, names, using=None):
+    """Make the task's tags exactly `names` (the owner's tags, created as needed)."""
+    using = using or task._state.db or router.db_for_write(Task, instance=task)
+    wanted = clean_tag_names(names)
+    with transaction.atomic(using=using):
+        _lock_tasks([task.pk], using)
+        current = dict(
+            TaskTag.objects.using(using).filter(task_id=task.pk).values_list('tag__normalized', 'tag_id')
+        )
+        removed = [tag_id for key, tag_id in current.items() if key not in wanted]
+        added = get_or_create_tags(
+            task.owner_id, {key: name for key, name in wanted.items() if key not in current}, using,
+        )
+        if removed:
+            TaskTag.objects.using(using).filter(task_id=task.pk, tag_id__in=removed).delete()
+        TaskTag.objects.using(using).bulk_create([TaskTag(task_id=task.pk, tag_id=tag.pk) for tag in added])
+        _adjust_counts({**{tag_id: -1 for tag_id in removed}, **{tag.pk: 1 for tag in added}}, using)
+    # the next read of task.tags goes back to the database
+    getattr(task, '_prefetched_objects_cache', {}).pop('tags', None)
+
+
+def release_tags(task_ids, using):
+    """
+    Take tasks that are about to be deleted or archived out of the tag counters.
+    Call inside the transaction that removes them. Returns {task_id: [tag names]}.
+    """
+    if not task_ids:
+        return {}
+    _lock_tasks(task_ids, using)
+    links = list(
+        TaskTag.objects.using(using).filter(task_id__in=task_ids)
+        .select_related('tag').only('task_id', 'tag__id', 'tag__name')
+    )
+    names = defaultdict(list)
+    deltas = defaultdict(int)
+    for link in links:
+        names[link.task_id].append(link.tag.name)
+        deltas[link.tag_id] -= 1
+    _adjust_counts(deltas, using)
+    TaskTag.objects.using(using).filter(task_id__in=task_ids).delete()
+    return dict(names)
+
+
+def recount_tags(owner_id, using):
+    """Recompute task_count from the links (repair after manual data changes)."""
+    counts = dict(
+        TaskTag.objects.using(using).filter(tag__owner_id=owner_id)
+        .values('tag_id').annotate(n=Count('pk')).values_list('tag_id', 'n')
+    )
+    tags = list(Tag.objects.using(using).filter(owner_id=owner_id))
+    for tag in tags:
+        tag.task_count = counts.get(tag.pk, 0)
+    Tag.objects.using(using).bulk_update(tags, ['task_count'])
@@ -1,3 +1,876 @@
-from django.test import TestCase
+import gzip
+import json
+import math
+import re
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from task_manager import middleware
+from task_manager.db_router import OwnerShardRouter, PrimaryReplicaRouter, shard_for_owner
+from task_manager.middleware import (
+    ActivityLogMiddleware, CompressionMiddleware, ConcurrencyLimitMiddleware, ReplicaRoutingMiddleware,
+)
+from task_manager.throttling import IPTokenBucketThrottle
+
+from . import activity, sharding
+from .models import Activity, IdSequence, ListShare, Tag, Task, TaskAccess, TaskArchive
+from .reminders import send_due_reminders
+from .sharing import share_list, share_task, unshare_task
+from .suggest import suggest_titles
+from .tags import release_tags, set_task_tags
+
+# with DB_TASK_SHARDS set, task rows live in the shard databases
+TEST_DATABASES = {'default', *settings.TASK_SHARDS}
+
+
+def create_user(email, near=None, shard=None):
+    """A user; with sharded tasks, one on `shard` or the shard of `near` (sharing stays within a shard)."""
+    shard = shard or (near and shard_for_owner(near.pk))
+    while True:
+        user = CustomUser.objects.create_user(email, password='x')
+        if not shard or shard_for_owner(user.pk) == shard:
+            return user
+        user.delete()
+
+
+@contextmanager
+def capture_queries():
+    """Queries run on any of TEST_DATABASES inside the block."""
+    queries = []
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in sorted(TEST_DATABASES)]
+        yield queries
+    for ctx in contexts:
+        queries.extend(ctx.captured_queries)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.body = b'{"tasks": [' + b', '.join(b'{"title": "task %d"}' % i for i in range(100)) + b']}'
+
+    def respond(self, content_type='application/json', body=None, accept='gzip, deflate, br'):
+        def view(request):
+            response = HttpResponse(self.body if body is None else body, content_type=content_type)
+            response['ETag'] = '"v1"'
+            return response
+
+        request = self.factory.get('/api/tasks/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(view)(request)
+
+    @skipUnless(middleware.brotli, 'brotli is not installed')
+    def test_brotli_for_json(self):
+        response = self.respond()
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+
+    def test_gzip_for_html_and_without_br(self):
+        for content_type, accept in (('text/html; charset=utf-8', 'gzip, br'), ('application/json', 'gzip')):
+            response = self.respond(content_type, accept=accept)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.content), self.body)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response['ETag'], 'W/"v1"')
+
+    def test_small_bodies_stay_as_they_are(self):
+        with override_settings(COMPRESSION_MIN_SIZE=len(self.body) + 1):
+            response = self.respond()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual((response.content, response['ETag']), (self.body, '"v1"'))
+        self.assertEqual(self.respond(accept='identity').content, self.body)
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        self.seen = []
+
+        def view(request):
+            self.seen.append(self.router.db_for_read(Task))
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+        replica = {**connections.databases['default'], 'TEST': {'MIRROR': 'default'}}
+        self.replica = mock.patch.dict(connections.databases, {'replica': replica})
+        self.no_replica = mock.patch.dict(
+            connections.databases, {'default': connections.databases['default']}, clear=True
+        )
+
+    def test_reads_use_primary_without_replica(self):
+        with self.no_replica:
+            self.middleware(self.factory.get('/api/tasks/'))
+        self.assertEqual(self.seen, ['default'])
+
+    def test_safe_reads_use_replica(self):
+        with self.replica:
+            self.middleware(self.factory.get('/api/tasks/'))
+        self.assertEqual(self.seen, ['replica'])
+        self.assertEqual(self.router.db_for_write(Task), 'default')
+
+    def test_write_pins_primary_and_sets_sticky_cookie(self):
+        with self.replica:
+            response = self.middleware(self.factory.post('/api/tasks/'))
+        self.assertEqual(self.seen, ['default'])
+        self.assertIn('pin_primary', response.cookies)
+
+    def test_sticky_cookie_reads_own_writes(self):
+        request = self.factory.get('/api/tasks/')
+        request.COOKIES['pin_primary'] = '1'
+        with self.replica:
+            self.middleware(request)
+            self.middleware(self.factory.get('/api/tasks/'))
+        self.assertEqual(self.seen, ['default', 'replica'])
+
+
+@override_settings(TASK_SHARDS=['shard_0', 'shard_1'])
+class OwnerShardRouterTests(SimpleTestCase):
+    def test_owner_picks_shard(self):
+        self.assertEqual(shard_for_owner(4), 'shard_0')
+        self.assertEqual(shard_for_owner(7), 'shard_1')
+
+    def test_routes_tasks_by_owner(self):
+        router = OwnerShardRouter()
+        self.assertEqual(router.db_for_write(Task, instance=Task(owner_id=7)), 'shard_1')
+        self.assertEqual(router.db_for_read(Task, instance=CustomUser(pk=4)), 'shard_0')
+        # no hint and non-task models fall through to the next router
+        self.assertIsNone(router.db_for_read(Task))
+        self.assertIsNone(router.db_for_read(CustomUser, instance=Task(owner_id=7)))
+
+    @override_settings(TASK_SHARDS=[])
+    def test_unsharded(self):
+        self.assertIsNone(shard_for_owner(4))
+
+
+@skipUnless(len(settings.TASK_SHARDS) >= 2, 'run the tests with DB_TASK_SHARDS=2')
+class ShardingTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.owner = create_user('sharded@example.com')
+        self.home = shard_for_owner(self.owner.pk)
+        # where the owner's tasks were before the shard count changed
+        self.old = next(alias for alias in settings.TASK_SHARDS if alias != self.home)
+
+    def test_task_ids_come_from_one_sequence(self):
+        with mock.patch.dict(sharding._id_block, {'next': 0, 'end': 0}), mock.patch.object(sharding, 'ID_BLOCK_SIZE', 3):
+            existing = Task.objects.using(self.old).create(owner=self.owner, title='old').pk
+            sharding._id_block.update(next=0, end=0)
+            IdSequence.objects.using('default').all().delete()
+            ids = [sharding.next_task_id() for _ in range(7)]
+        self.assertEqual(ids, list(range(existing + 1, existing + 8)))
+        self.assertEqual(IdSequence.objects.using('default').get().last_value, existing + 9)
+
+    def test_users_are_replicated_to_every_shard(self):
+        self.owner.email = 'renamed@example.com'
+        self.owner.save()
+        for alias in settings.TASK_SHARDS:
+            self.assertEqual(CustomUser.objects.using(alias).get(pk=self.owner.pk).email, 'renamed@example.com')
+        self.owner.delete()
+        for alias in settings.TASK_SHARDS:
+            self.assertFalse(CustomUser.objects.using(alias).filter(pk=self.owner.pk).exists())
+
+    def test_rebalance_moves_trees_tags_and_access(self):
+        tasks = Task.objects.using(self.old)
+        parent = tasks.create(owner=self.owner, title='parent')
+        child = tasks.create(owner=self.owner, title='child', parent=parent, status='done')
+        set_task_tags(child, ['a'])
+        out = StringIO()
+        call_command('rebalance_task_shards', '--batch-size', '1', stdout=out)
+        self.assertIn('moved 2 task(s)', out.getvalue())
+
+        moved = {t.title: t for t in Task.objects.for_owner(self.owner)}
+        self.assertEqual(moved['child'].path, f'{parent.pk}/')
+        self.assertEqual((moved['parent'].subtask_count, moved['parent'].subtask_done_count), (1, 1))
+        self.assertEqual(list(moved['child'].tags.values_list('name', 'task_count')), [('a', 1)])
+        self.assertEqual(TaskAccess.objects.using(self.home).filter(task__owner=self.owner).count(), 2)
+        for model in (Task, Tag, TaskAccess):
+            self.assertFalse(model._base_manager.using(self.old).exists())
+
+    def test_rebalance_moves_archived_tasks(self):
+        now = timezone.now()
+        TaskArchive.objects.using(self.old).create(
+            id=10 ** 6, owner=self.owner, title='archived', created_at=now - timedelta(days=90), updated_at=now,
+        )
+        # an owner with nothing but archived tasks
+        other = create_user('archived-only@example.com', shard=self.home)
+        TaskArchive.objects.using(self.old).create(
+            id=10 ** 6 + 1, owner=other, title='theirs', created_at=now, updated_at=now,
+        )
+        Task.objects.using(self.old).create(owner=self.owner, title='live')
+        out = StringIO()
+        call_command('rebalance_task_shards', stdout=out)
+        self.assertIn('moved 3 task(s)', out.getvalue())
+        archived = TaskArchive.objects.for_owner(self.owner).get()
+        self.assertEqual((archived.pk, archived.created_at), (10 ** 6, now - timedelta(days=90)))
+        self.assertEqual(TaskArchive.objects.for_owner(other).get().title, 'theirs')
+        self.assertFalse(TaskArchive._base_manager.using(self.old).exists())
+        self.client.force_login(self.owner)
+        response = self.client.get('/api/tasks/', {'include_archived': 1})
+        self.assertEqual(sorted(t['title'] for t in response.json()), ['archived', 'live'])
+
+    def test_rebalance_reports_shares_it_cannot_keep(self):
+        task = Task.objects.using(self.old).create(owner=self.owner, title='shared')
+        near = create_user('near@example.com', shard=self.home)
+        far = create_user('far@example.com', shard=self.old)
+        # granted while owner and users were on one shard, before the shard count changed
+        TaskAccess.objects.using(self.old).create(task_id=task.pk, user=near, role=TaskAccess.VIEWER)
+        ListShare.objects.using(self.old).create(owner=self.owner, user=far, role=TaskAccess.VIEWER)
+        TaskAccess.objects.using(self.old).create(task_id=task.pk, user=far, role=TaskAccess.VIEWER, via_list=True)
+
+        out = StringIO()
+        call_command('rebalance_task_shards', '--dry-run', stdout=out)
+        self.assertIn(f'user(s) {far.pk} on another shard would be dropped', out.getvalue())
+        call_command('rebalance_task_shards', stdout=out)
+        self.assertIn(f'user(s) {far.pk} on another shard were dropped', out.getvalue())
+        self.assertEqual(Task.objects.visible_to(near).get().pk, task.pk)
+        self.assertFalse(ListShare.objects.using(self.home).exists())
+        self.assertFalse(TaskAccess.objects.using(self.home).filter(user=far).exists())
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'ip_read': '3/min', 'ip_write': '1/min'}})
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_burst_then_refuse_with_wait(self):
+        throttle = IPTokenBucketThrottle()
+        request = self.factory.get('/api/tasks/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual([throttle.allow_request(request, None) for _ in range(4)], [True, True, True, False])
+        self.assertGreater(throttle.wait(), 0)
+        self.assertLessEqual(throttle.wait(), 20)
+
+    def test_reads_and_writes_have_separate_buckets(self):
+        throttle = IPTokenBucketThrottle()
+        write = self.factory.post('/api/tasks/', REMOTE_ADDR='10.0.0.3')
+        read = self.factory.get('/api/tasks/', REMOTE_ADDR='10.0.0.3')
+        self.assertTrue(throttle.allow_request(write, None))
+        self.assertFalse(throttle.allow_request(write, None))
+        self.assertTrue(throttle.allow_request(read, None))
+
+
+@override_settings(MAX_CONCURRENT_REQUESTS=2, LOAD_SHED_RETRY_AFTER=3)
+class ConcurrencyLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/api/tasks/')
+
+    def in_flight(self):
+        return cache.get(ConcurrencyLimitMiddleware.cache_key)
+
+    def test_sheds_beyond_the_limit_with_retry_after(self):
+        third = []
+
+        def view(request):
+            # a third request arrives while two are in flight
+            third.append(ConcurrencyLimitMiddleware(lambda r: HttpResponse())(request))
+            return HttpResponse()
+
+        two_in_flight = ConcurrencyLimitMiddleware(ConcurrencyLimitMiddleware(view))
+        self.assertEqual(two_in_flight(self.request).status_code, 200)
+        self.assertEqual(third[0].status_code, 503)
+        self.assertEqual(third[0]['Retry-After'], '3')
+        self.assertEqual(self.in_flight(), 0)
+
+    def test_failed_requests_leave(self):
+        def view(request):
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            ConcurrencyLimitMiddleware(view)(self.request)
+        self.assertEqual(self.in_flight(), 0)
+        self.assertEqual(ConcurrencyLimitMiddleware(lambda r: HttpResponse())(self.request).status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class TaskSharingTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.owner = create_user('owner@example.com')
+        self.reader = create_user('reader@example.com', near=self.owner)
+        self.task = Task.objects.create(owner=self.owner, title='shared')
+        share_task(self.task, self.reader, TaskAccess.VIEWER)
+        self.client.force_login(self.reader)
+
+    def add_collaborators(self, count):
+        for i in range(count):
+            user = create_user(f'c{i}@example.com', near=self.owner)
+            share_task(self.task, user, TaskAccess.EDITOR)
+            # and more owners sharing with the reader
+            other = Task.objects.create(owner=user, title=f'from c{i}')
+            share_task(other, self.reader, TaskAccess.VIEWER)
+
+    def count_queries(self, method, path, **kwargs):
+        with capture_queries() as queries:
+            response = getattr(self.client, method)(path, content_type='application/json', **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_collaborators(self):
+        before = self.count_queries('get', '/api/tasks/')
+        self.add_collaborators(5)
+        self.assertEqual(self.count_queries('get', '/api/tasks/'), before)
+        self.assertEqual(len(self.client.get('/api/tasks/').json()), 6)
+
+    def test_object_checks_do_not_grow_with_collaborators(self):
+        share_task(self.task, self.reader, TaskAccess.EDITOR)
+        path = f'/api/tasks/{self.task.pk}/'
+        before = [self.count_queries('get', path), self.count_queries('patch', path, data={'title': 'a'})]
+        self.add_collaborators(5)
+        after = [self.count_queries('get', path), self.count_queries('patch', path, data={'title': 'b'})]
+        self.assertEqual(after, before)
+
+    def test_roles(self):
+        path = f'/api/tasks/{self.task.pk}/'
+        self.assertEqual(self.client.get(path).json()['access_role'], TaskAccess.VIEWER)
+        self.assertEqual(self.client.patch(path, {'title': 'x'}, content_type='application/json').status_code, 403)
+        share_task(self.task, self.reader, TaskAccess.EDITOR)
+        self.assertEqual(self.client.patch(path, {'title': 'x'}, content_type='application/json').status_code, 200)
+        self.assertEqual(self.client.delete(path).status_code, 403)
+
+    def test_only_owner_lists_collaborators(self):
+        path = f'/api/tasks/{self.task.pk}/access/'
+        self.assertEqual(self.client.get(path).status_code, 403)
+        share_task(self.task, self.reader, TaskAccess.EDITOR)
+        self.assertEqual(self.client.get(path).status_code, 403)
+        self.client.force_login(self.owner)
+        self.assertEqual(len(self.client.get(path).json()), 2)
+
+    def test_shared_filter_leaves_out_own_archive(self):
+        now = timezone.now()
+        TaskArchive.objects.create(id=self.task.pk + 1000, owner=self.reader, title='old', created_at=now, updated_at=now)
+        titles = lambda **params: [t['title'] for t in self.client.get('/api/tasks/', params).json()]
+        self.assertEqual(titles(shared=1, include_archived=1), ['shared'])
+        self.assertEqual(sorted(titles(shared=0, include_archived=1)), ['old'])
+
+    def test_list_share_covers_new_tasks(self):
+        other = create_user('other@example.com', near=self.owner)
+        share_list(self.owner, other, TaskAccess.VIEWER)
+        Task.objects.create(owner=self.owner, title='later')
+        self.assertEqual(Task.objects.visible_to(other).count(), 2)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class TaskPageTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('page@example.com')
+        friend = create_user('page-friend@example.com', near=self.user)
+        share_task(Task.objects.create(owner=friend, title='shared with me'), self.user, TaskAccess.EDITOR)
+        Task.objects.create(owner=self.user, title='archived', status='done')
+        Task.objects.for_owner(self.user).update(updated_at=timezone.now() - timedelta(days=40))
+        call_command('archive_tasks', '--older-than', '30', stdout=StringIO())
+        for title in ('first', 'second', 'third'):
+            Task.objects.create(owner=self.user, title=title, status='done' if title == 'second' else 'todo')
+        self.client.force_login(self.user)
+
+    def embedded(self):
+        html = self.client.get('/').content.decode()
+        return json.loads(re.search(r'<script id="initialTasks" type="application/json">(.*?)</script>', html).group(1))
+
+    def test_embedded_page_matches_the_api(self):
+        data = self.embedded()
+        self.assertEqual(data['results'], self.client.get('/api/tasks/').json())
+        self.assertEqual(data['counts'], self.client.get('/api/tasks/stats/').json())
+        self.assertEqual(data['user'], self.user.pk)
+        # main.js skips the API call when the embedded page holds every task
+        self.assertEqual(len(data['results']), data['counts']['all'])
+        self.assertIn('shared with me', [t['title'] for t in data['results']])
+        self.assertNotIn('archived', [t['title'] for t in data['results']])
+
+    @override_settings(TASKS_INITIAL_PAGE_SIZE=2)
+    def test_partial_first_page(self):
+        data = self.embedded()
+        self.assertEqual(data['results'], self.client.get('/api/tasks/').json()[:2])
+        self.assertLess(len(data['results']), data['counts']['all'])
+
+
+class ActivityLogTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('actor@example.com')
+        self.factory = RequestFactory()
+
+    def run_request(self, status, count):
+        def view(request):
+            for i in range(count):
+                activity.record('updated', self.user, i + 1, title=['a', 'b'])
+            return HttpResponse(status=status)
+
+        with capture_queries() as queries:
+            ActivityLogMiddleware(view)(self.factory.post('/api/tasks/1/'))
+        return [q['sql'] for q in queries if q['sql'].startswith('INSERT')]
+
+    def test_one_insert_per_request(self):
+        self.assertEqual(len(self.run_request(200, 5)), 1)
+        self.assertEqual(Activity.objects.filter(actor=self.user).count(), 5)
+
+    def test_failed_request_writes_nothing(self):
+        self.assertEqual(self.run_request(400, 3), [])
+        self.assertFalse(Activity.objects.exists())
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class TaskTagTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('tagger@example.com')
+        self.client.force_login(self.user)
+
+    def counts(self):
+        return dict(Tag.objects.for_owner(self.user).values_list('name', 'task_count'))
+
+    def test_counters_follow_tag_changes(self):
+        first = Task.objects.create(owner=self.user, title='first')
+        second = Task.objects.create(owner=self.user, title='second')
+        set_task_tags(first, ['Work', 'home'])
+        set_task_tags(second, ['work'])
+        self.assertEqual(self.counts(), {'Work': 2, 'home': 1})
+        set_task_tags(first, ['home', 'home'])
+        self.assertEqual(self.counts(), {'Work': 1, 'home': 1})
+        release_tags([first.pk, second.pk], first._state.db)
+        self.assertEqual(self.counts(), {'Work': 0, 'home': 0})
+
+    @skipIf(settings.TASK_SHARDS, 'the admin lists the tasks stored in default only')
+    def test_admin_delete_releases_tags(self):
+        task = Task.objects.create(owner=self.user, title='gone')
+        set_task_tags(task, ['a'])
+        admin_user = CustomUser.objects.create_superuser('admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        self.client.post(f'/admin/tasks/task/{task.pk}/delete/', {'post': 'yes'})
+        self.assertFalse(Task.objects.for_owner(self.user).filter(pk=task.pk).exists())
+        self.assertEqual(self.counts(), {'a': 0})
+
+    def test_list_prefetches_tags(self):
+        def list_queries():
+            with capture_queries() as queries:
+                self.client.get('/api/tasks/')
+            return len(queries)
+
+        set_task_tags(Task.objects.create(owner=self.user, title='one'), ['a'])
+        before = list_queries()
+        for i in range(5):
+            set_task_tags(Task.objects.create(owner=self.user, title=f't{i}'), ['a', f'b{i}'])
+        self.assertEqual(list_queries(), before)
+
+    def test_tag_filter_and_facets(self):
+        set_task_tags(Task.objects.create(owner=self.user, title='both'), ['a', 'b'])
+        set_task_tags(Task.objects.create(owner=self.user, title='only a'), ['a'])
+        titles = lambda **params: sorted(t['title'] for t in self.client.get('/api/tasks/', params).json())
+        self.assertEqual(titles(tag='a,b'), ['both', 'only a'])
+        self.assertEqual(titles(tag='a,b', tag_match='all'), ['both'])
+        facets = self.client.get('/api/tasks/tags/', {'q': 'only'}).json()
+        self.assertEqual(facets, [{'name': 'a', 'count': 1}])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class SubtaskTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('nester@example.com')
+        self.client.force_login(self.user)
+
+    def chain(self, depth, parent=None):
+        tasks = []
+        for i in range(depth):
+            parent = Task.objects.create(owner=self.user, title=f'level {i}', parent=parent)
+            tasks.append(parent)
+        return tasks
+
+    def progress(self, task):
+        return tuple(Task.objects.for_owner(self.user).filter(pk=task.pk).values_list('subtask_count', 'subtask_done_count')[0])
+
+    def test_counters_follow_children(self):
+        parent = Task.objects.create(owner=self.user, title='parent')
+        child = Task.objects.create(owner=self.user, title='child', parent=parent)
+        Task.objects.create(owner=self.user, title='done', parent=parent, status='done')
+        self.assertEqual(self.progress(parent), (2, 1))
+        child.status = 'done'
+        child.save()
+        self.assertEqual(self.progress(parent), (2, 2))
+        other = Task.objects.create(owner=self.user, title='other')
+        child.parent = other
+        child.save()
+        self.assertEqual((self.progress(parent), self.progress(other)), ((1, 1), (1, 1)))
+        self.client.delete(f'/api/tasks/{other.pk}/')
+        self.assertFalse(Task.objects.for_owner(self.user).filter(pk=child.pk).exists())
+
+    def test_saving_a_stale_parent_keeps_counters(self):
+        parent = Task.objects.create(owner=self.user, title='parent')
+        stale = Task.objects.for_owner(self.user).get(pk=parent.pk)
+        Task.objects.create(owner=self.user, title='done', parent=parent, status='done')
+        stale.is_favorite = True
+        stale.save()
+        self.assertEqual(self.progress(parent), (1, 1))
+        self.client.post(f'/api/tasks/{parent.pk}/toggle-favorite/')
+        self.client.patch(f'/api/tasks/{parent.pk}/', {'title': 'renamed'}, content_type='application/json')
+        self.assertEqual(self.progress(parent), (1, 1))
+
+    def test_moving_a_subtree_rewrites_paths(self):
+        first, second, third = self.chain(3)
+        second.parent = None
+        second.save()
+        third.refresh_from_db()
+        self.assertEqual((third.path, third.depth), (f'{second.pk}/', 1))
+        response = self.client.patch(
+            f'/api/tasks/{second.pk}/', {'parent': third.pk}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_subtree_queries_do_not_grow_with_depth(self):
+        def subtree_queries(root):
+            with capture_queries() as queries:
+                response = self.client.get(f'/api/tasks/{root.pk}/subtree/')
+            return len(queries), response.json()
+
+        shallow = self.chain(2)[0]
+        deep = self.chain(8)[0]
+        self.assertEqual(subtree_queries(shallow)[0], subtree_queries(deep)[0])
+        node, levels = subtree_queries(deep)[1], 0
+        while node['subtasks']:
+            node, levels = node['subtasks'][0], levels + 1
+        self.assertEqual(levels, 7)
+
+    def test_sharing_covers_existing_subtasks(self):
+        root, child, grandchild = self.chain(3)
+        reader = create_user('sub-reader@example.com', near=self.user)
+        share_task(root, reader, TaskAccess.VIEWER)
+        self.client.force_login(reader)
+        subtree = self.client.get(f'/api/tasks/{root.pk}/subtree/').json()
+        self.assertEqual(subtree['subtasks'][0]['subtasks'][0]['id'], grandchild.pk)
+        unshare_task(child, reader)
+        self.assertEqual(self.client.get(f'/api/tasks/{root.pk}/subtree/').json()['subtasks'], [])
+        self.assertEqual(self.client.get(f'/api/tasks/{grandchild.pk}/').status_code, 404)
+
+    def test_parent_and_depth_filters(self):
+        root = self.chain(4)[0]
+        titles = lambda **params: sorted(t['title'] for t in self.client.get('/api/tasks/', params).json())
+        self.assertEqual(titles(parent=root.pk), ['level 1'])
+        self.assertEqual(titles(parent=root.pk, depth=2), ['level 1', 'level 2'])
+        self.assertEqual(titles(parent=root.pk, depth='all'), ['level 1', 'level 2', 'level 3'])
+        self.assertEqual(titles(parent='none'), ['level 0'])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class SuggestTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('suggester@example.com')
+        self.client.force_login(self.user)
+        self.ids = {
+            title: Task.objects.create(owner=self.user, title=title).pk
+            for title in ('Alpha', 'alpine', 'Älteste', 'beta')
+        }
+
+    def suggest(self, prefix, **params):
+        response = self.client.get('/api/tasks/suggest/', {'prefix': prefix, **params})
+        return [t['title'] for t in response.json()]
+
+    def titles(self, prefix, limit=8):
+        return [title for _, title in suggest_titles(self.user, prefix, limit)]
+
+    def test_prefix_and_limit(self):
+        self.assertEqual(self.suggest('AL'), ['Alpha', 'alpine', 'Älteste'])
+        self.assertEqual(self.suggest('äl'), ['Alpha', 'alpine', 'Älteste'])
+        self.assertEqual(self.suggest('al', limit=2), ['Alpha', 'alpine'])
+        self.assertEqual(self.suggest('al', limit=0), ['Alpha'])
+        self.assertEqual(self.suggest('al', limit='x'), ['Alpha', 'alpine', 'Älteste'])
+        self.assertEqual(self.suggest('  '), [])
+        other = create_user('other-suggester@example.com')
+        Task.objects.create(owner=other, title='Alps')
+        self.assertEqual(self.suggest('alps'), [])
+
+    def test_longer_prefix_comes_from_a_complete_shorter_one(self):
+        self.assertEqual(self.titles('al'), ['Alpha', 'alpine', 'Älteste'])
+        with capture_queries() as queries:
+            self.assertEqual(self.titles('alp'), ['Alpha', 'alpine'])
+            self.assertEqual(self.titles('al', limit=2), ['Alpha', 'alpine'])
+        self.assertEqual(queries, [])
+
+    def test_truncated_results_are_not_reused(self):
+        self.assertEqual(self.titles('al', limit=2), ['Alpha', 'alpine'])
+        with capture_queries() as queries:
+            self.assertEqual(self.titles('alt'), ['Älteste'])
+        self.assertEqual(len(queries), 1)
+        with capture_queries() as queries:
+            self.assertEqual(self.titles('al', limit=3), ['Alpha', 'alpine', 'Älteste'])
+        self.assertEqual(len(queries), 1)
+
+    def test_changes_drop_the_cached_prefixes(self):
+        self.assertEqual(self.titles('al'), ['Alpha', 'alpine', 'Älteste'])
+        self.client.patch(f"/api/tasks/{self.ids['Alpha']}/", {'title': 'gamma'}, content_type='application/json')
+        self.assertEqual(self.titles('al'), ['alpine', 'Älteste'])
+        self.client.delete(f"/api/tasks/{self.ids['alpine']}/")
+        self.assertEqual(self.titles('al'), ['Älteste'])
+
+        tasks = Task.objects.for_owner(self.user)
+        tasks.filter(pk=self.ids['Älteste']).update(status='done', updated_at=timezone.now() - timedelta(days=40))
+        call_command('archive_tasks', '--older-than', '30', stdout=StringIO())
+        self.assertEqual(self.titles('al'), [])
+        self.client.patch(f"/api/tasks/{self.ids['Älteste']}/", {'status': 'todo'}, content_type='application/json')
+        self.assertEqual(self.titles('al'), ['Älteste'])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class TaskArchiveTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('archivist@example.com')
+        self.client.force_login(self.user)
+        self.tasks = Task.objects.for_owner(self.user)
+
+    def archive(self, *args):
+        # everything not updated for 40 days qualifies
+        self.tasks.update(updated_at=timezone.now() - timedelta(days=40))
+        out = StringIO()
+        call_command('archive_tasks', '--older-than', '30', *args, stdout=out)
+        return out.getvalue()
+
+    def test_archives_in_batches(self):
+        for i in range(5):
+            Task.objects.create(owner=self.user, title=f'done {i}', status='done')
+        Task.objects.create(owner=self.user, title='open')
+        out = self.archive('--batch-size', '2')
+        self.assertEqual([line.split(': ')[-1] for line in out.splitlines()[:3]], [
+            'archived 2 task(s)', 'archived 2 task(s)', 'archived 1 task(s)',
+        ])
+        self.assertEqual(list(self.tasks.values_list('title', flat=True)), ['open'])
+        self.assertEqual(TaskArchive.objects.for_owner(self.user).count(), 5)
+
+    def test_tasks_with_subtasks_wait_for_them(self):
+        parent = Task.objects.create(owner=self.user, title='parent', status='done')
+        child = Task.objects.create(owner=self.user, title='child', parent=parent)
+        self.archive()
+        self.assertEqual(self.tasks.count(), 2)
+        child.status = 'done'
+        child.save()
+        self.archive()
+        self.assertFalse(self.tasks.exists())
+        self.assertEqual(TaskArchive.objects.for_owner(self.user).get(pk=child.pk).parent_id, parent.pk)
+
+    def test_restore_brings_back_tags_and_progress(self):
+        parent = Task.objects.create(owner=self.user, title='parent')
+        child = Task.objects.create(owner=self.user, title='child', parent=parent, status='done')
+        set_task_tags(child, ['a'])
+        progress = lambda: tuple(self.tasks.values_list('subtask_count', 'subtask_done_count').get(pk=parent.pk))
+        tag_count = lambda: Tag.objects.for_owner(self.user).get().task_count
+        self.archive()
+        self.assertEqual((progress(), tag_count()), ((0, 0), 0))
+
+        response = self.client.patch(f'/api/tasks/{child.pk}/', {'title': 'child again'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['tags'], response.json()['parent']), (['a'], parent.pk))
+        self.assertEqual((progress(), tag_count()), ((1, 1), 1))
+        self.assertFalse(TaskArchive.objects.for_owner(self.user).exists())
+
+    def test_list_merges_archive_in_order(self):
+        for title in ('a', 'c'):
+            Task.objects.create(owner=self.user, title=title, status='done')
+        self.archive()
+        Task.objects.create(owner=self.user, title='B', status='done')
+        titles = lambda **params: [t['title'] for t in self.client.get('/api/tasks/', params).json()]
+        self.assertEqual(titles(include_archived=1, ordering='title'), ['a', 'B', 'c'])
+        self.assertEqual(titles(include_archived=1, ordering='title_desc'), ['c', 'B', 'a'])
+        self.assertEqual(titles(include_archived=1, status='pending'), [])
+        self.assertEqual(titles(ordering='title'), ['B'])
+
+    @skipIf(settings.TASK_SHARDS, 'the admin lists the tasks stored in default only')
+    def test_admin_searches_the_normalized_title(self):
+        for title in ('Älteste', 'beta'):
+            Task.objects.create(owner=self.user, title=title, status='done')
+        self.archive()
+        self.assertEqual(TaskArchive.objects.for_owner(self.user).get(title='Älteste').title_normalized, 'alteste')
+        self.client.force_login(CustomUser.objects.create_superuser('archive-admin@example.com', password='x'))
+        with capture_queries() as queries:
+            response = self.client.get('/admin/tasks/taskarchive/', {'q': 'ALT'})
+        self.assertEqual([a.title for a in response.context['cl'].result_list], ['Älteste'])
+        self.assertTrue(any('"title_normalized" LIKE' in q['sql'] for q in queries))
+
+    def test_counts_keep_the_archive_apart(self):
+        Task.objects.create(owner=self.user, title='old', status='done')
+        self.archive()
+        Task.objects.create(owner=self.user, title='new', status='done')
+        counts = self.client.get('/api/tasks/stats/').json()
+        # the Completed filter lists live tasks, the archive only on request
+        self.assertEqual((counts['completed'], counts['archived']), (1, 1))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class TaskMoveTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('mover@example.com')
+        self.client.force_login(self.user)
+        self.tasks = Task.objects.for_owner(self.user)
+        self.ids = {}
+        for position, title in enumerate('abcd', start=1):
+            task = Task.objects.create(owner=self.user, title=title)
+            self.tasks.filter(pk=task.pk).update(position=position)
+            self.ids[title] = task.pk
+
+    def move(self, title, **neighbours):
+        data = {key: self.ids.get(value, value) for key, value in neighbours.items()}
+        return self.client.post(f'/api/tasks/{self.ids[title]}/move/', data, content_type='application/json')
+
+    def order(self):
+        return ''.join(self.tasks.order_by('position').values_list('title', flat=True))
+
+    def test_one_neighbour(self):
+        self.assertEqual(self.move('d', after='a').json()['position'], 1.5)
+        self.assertEqual(self.order(), 'adbc')
+        self.move('a', before='c')
+        self.assertEqual(self.order(), 'dbac')
+        self.move('c', before='d')
+        self.assertEqual(self.order(), 'cdba')
+
+    def test_saving_a_stale_task_keeps_its_position(self):
+        stale = self.tasks.get(pk=self.ids['d'])
+        self.move('d', after='a')
+        stale.is_favorite = True
+        stale.save()
+        self.client.patch(f"/api/tasks/{self.ids['d']}/", {'title': 'd'}, content_type='application/json')
+        self.assertEqual(self.order(), 'adbc')
+
+    def test_both_neighbours(self):
+        self.move('d', after='a', before='b')
+        self.assertEqual(self.order(), 'adbc')
+
+    def test_bad_neighbours(self):
+        self.assertEqual(self.move('d', after='b', before='a').status_code, 400)
+        self.assertEqual(self.move('d', after='d').status_code, 400)
+        self.assertEqual(self.move('d').status_code, 400)
+        self.assertEqual(self.move('d', after=10 ** 9).status_code, 404)
+        self.assertEqual(self.order(), 'abcd')
+
+    def test_renumbers_when_precision_runs_out(self):
+        self.tasks.filter(pk=self.ids['b']).update(position=math.nextafter(1.0, 2.0))
+        response = self.move('d', after='a', before='b')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), 'adbc')
+        self.assertEqual(response.json()['position'], 1.5)
+
+    def test_renumbers_before_the_gap_gets_too_small(self):
+        self.tasks.filter(pk=self.ids['b']).update(position=1.0 + 1e-7)
+        response = self.move('d', after='a', before='b')
+        self.assertEqual(self.order(), 'adbc')
+        self.assertEqual(list(self.tasks.order_by('position').values_list('position', flat=True)), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(response.json()['position'], 2.0)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []})
+class ReminderTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.user = create_user('reminded@example.com')
+        self.using = Task.objects.for_owner(self.user).db
+        self.now = timezone.now()
+
+    def due_task(self, title, owner=None, **fields):
+        return Task.objects.create(owner=owner or self.user, title=title, remind_at=self.now - timedelta(minutes=1), **fields)
+
+    def state(self, task):
+        return tuple(Task.objects.using(self.using).values_list('remind_at', 'reminded_at').get(pk=task.pk))
+
+    def test_one_email_per_owner(self):
+        other = create_user('also-reminded@example.com', near=self.user)
+        first, second = self.due_task('first'), self.due_task('second')
+        self.due_task('finished', status='done')
+        self.due_task('theirs', owner=other)
+        Task.objects.create(owner=self.user, title='later', remind_at=self.now + timedelta(hours=1))
+        self.assertEqual(send_due_reminders(self.using, now=self.now), 4)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['also-reminded@example.com', 'reminded@example.com'])
+        body = next(m.body for m in mail.outbox if m.to == ['reminded@example.com'])
+        self.assertIn('- first', body)
+        self.assertIn('- second', body)
+        self.assertNotIn('finished', body)
+        self.assertEqual(self.state(first), (None, self.now))
+        self.assertEqual(send_due_reminders(self.using, now=self.now), 0)
+
+    def test_claims_that_fail_to_send_stay_due(self):
+        task = self.due_task('first')
+        due = self.state(task)
+        with mock.patch('tasks.reminders._send', side_effect=OSError('smtp down')):
+            with self.assertRaises(OSError):
+                send_due_reminders(self.using, now=self.now)
+        self.assertEqual(self.state(task), due)
+
+    def test_locking_path_rolls_back_failed_sends(self):
+        task = self.due_task('first')
+        due = self.state(task)
+        features = connections[self.using].features
+        with mock.patch.object(features, 'has_select_for_update_skip_locked', True):
+            with mock.patch('tasks.reminders._send', side_effect=OSError('smtp down')):
+                with self.assertRaises(OSError):
+                    send_due_reminders(self.using, now=self.now)
+            self.assertEqual(self.state(task), due)
+            self.assertEqual(send_due_reminders(self.using, now=self.now), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_claim_is_lost_to_another_scheduler(self):
+        task = self.due_task('first')
+        stale = Task.objects.using(self.using).get(pk=task.pk)
+        # another scheduler claimed it after this one read it
+        Task.objects.using(self.using).filter(pk=task.pk).update(remind_at=None, reminded_at=self.now)
+        with mock.patch('tasks.reminders._due', return_value=[stale]):
+            self.assertEqual(send_due_reminders(self.using, now=self.now), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_loop_survives_send_errors(self):
+        class Stop(Exception):
+            pass
+
+        calls = []
+
+        def send(using, batch_size):
+            calls.append(using)
+            if len(calls) == 1:
+                raise OSError('smtp down')
+            return 0
+
+        err = StringIO()
+        with mock.patch('tasks.management.commands.run_reminders.send_due_reminders', side_effect=send), \
+                mock.patch('tasks.management.commands.run_reminders.time.sleep', side_effect=[None, Stop]):
+            with self.assertRaises(Stop):
+                call_command('run_reminders', '--loop', stderr=err, stdout=StringIO())
+        self.assertEqual(len(calls), 2 * len(TEST_DATABASES))
+        self.assertIn('sending reminders failed', err.getvalue())
+
+    def test_due_filter(self):
+        self.client.force_login(self.user)
+        tonight = timezone.localtime(self.now).replace(hour=23, minute=59, second=59)
+        Task.objects.create(owner=self.user, title='late', due_at=self.now - timedelta(days=1))
+        Task.objects.create(owner=self.user, title='late but done', due_at=self.now - timedelta(days=1), status='done')
+        Task.objects.create(owner=self.user, title='tonight', due_at=tonight)
+        Task.objects.create(owner=self.user, title='soon', due_at=tonight + timedelta(days=3))
+        Task.objects.create(owner=self.user, title='someday')
+        titles = lambda due: sorted(t['title'] for t in self.client.get('/api/tasks/', {'due': due}).json())
+        self.assertEqual(titles('overdue'), ['late'])
+        self.assertEqual(titles('today'), ['tonight'])
+        self.assertEqual(titles('week'), ['soon', 'tonight'])
@@ -0,0 +1,25 @@
+# tasks/utils.py
+import unicodedata
+
+from django.db.models import sql
+from django.db.models.constants import OnConflict
+
+
+def insert_rows(model, objs, using, ignore_conflicts=False):
+    """
+    Insert objs exactly as they are, pks and auto_now/auto_now_add values included
+    (bulk_create would refresh the timestamps). Used to move rows between tables/databases.
+    No signals are sent, like bulk_create.
+    """
+    if not objs:
+        return
+    query = sql.InsertQuery(model, on_conflict=OnConflict.IGNORE if ignore_conflicts else None)
+    query.insert_values(model._meta.concrete_fields, objs, raw=True)
+    query.get_compiler(using=using).execute_sql()
+
+
+def normalize_title(title):
+    """Lowercase, accent-free, single-spaced form of a title, used for prefix lookups."""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())[:200]
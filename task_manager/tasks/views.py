@@ -1,13 +1,48 @@
 # tasks/views.py
+from datetime import timedelta
+from operator import attrgetter
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q, Subquery
+from django.http import Http404
 from django.shortcuts import render
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 
-from .models import Task
-from .serializers import TaskSerializer
-from .permissions import IsOwnerOrReadOnly
+from task_manager.paginators import ActivityCursorPagination
+
+from . import activity as activity_log
+from .models import Activity, ListShare, Tag, Task, TaskAccess, TaskArchive, TaskTag
+from .ordering import lock_owner, needs_rebalance, position_between, rebalance_positions
+from .serializers import (
+    ActivitySerializer, ListShareSerializer, TagSerializer, TaskAccessSerializer, TaskSerializer,
+)
+from .permissions import HasTaskAccess
+from .sharing import SharingError, share_list, share_task, unshare_list, unshare_task
+from .subtasks import delete_subtree, descendants
+from .suggest import suggest_titles
+from .tags import clean_tag_names
+from .utils import normalize_title
+
+
+def task_counts(user):
+    """Counts shown on the filter buttons; archived is the size of the owner's archive (an opt-in of Completed)."""
+    counts = Task.objects.visible_to(user).aggregate(
+        all=Count('pk'),
+        pending=Count('pk', filter=~Q(status='done')),
+        completed=Count('pk', filter=Q(status='done')),
+        favorites=Count('pk', filter=Q(is_favorite=True)),
+        shared=Count('pk', filter=~Q(access_role=TaskAccess.OWNER)),
+    )
+    counts['archived'] = TaskArchive.objects.for_owner(user).count()
+    return counts
 
 
 class TaskViewSet(viewsets.ModelViewSet):
@@ -16,20 +51,90 @@ class TaskViewSet(viewsets.ModelViewSet):
       - ?q=<text>           -> title__icontains (search)
       - ?status=<value>     -> todo|inprogress|done, also 'pending' and 'completed'
       - ?favorite=1         -> is_favorite=True
+      - ?due=<value>        -> overdue (past due, not done), today, week (due in the next 7 days)
+      - ?shared=1           -> only tasks shared with me (?shared=0: only my own)
+      - ?tag=a,b            -> tasks tagged a or b; with ?tag_match=all, tagged a and b
+      - ?parent=<id>        -> subtasks of a task, ?depth=<n> levels down (default 1, 'all' for
+            the whole subtree); ?parent=none -> top-level tasks only; ?depth=<n> alone -> tasks
+            less than n levels deep
+      - /<id>/subtree/      -> the task with its subtasks nested under "subtasks" (?depth as above,
+            default all)
+      - /tags/              -> [{name, count}] of the tasks matching the other filters
+      - ?include_archived=1 -> also list archived (done) tasks, see archive_tasks
+      - /suggest/?prefix=   -> up to ?limit (max 20) {id, title} whose title starts with prefix
       - ?ordering=<value>   -> ordering field/alias:
-            allowed aliases: newest, oldest, title_asc, title_desc
-            allowed direct fields: created_at, -created_at, title, -title
+            allowed aliases: newest, oldest, title_asc, title_desc, manual
+            allowed direct fields: created_at, -created_at, title, -title, position
+      - POST /<id>/move/ {"after": <id|null>, "before": <id|null>} -> place the task between
+            two neighbours of the manual order (one row written)
+
+      - GET|POST|DELETE /<id>/access/ {"user": <email|username>, "role": "viewer|editor"}
+            -> who can see a task / share it / stop sharing it (owner only)
+      - GET|POST|DELETE /shares/ {"user": ..., "role": ...} -> share all my tasks with someone
+      - GET /<id>/activity/  -> who changed what, newest first (cursor pages of ?page_size)
+
+    Lists cover own and shared tasks; viewers can read, editors can also edit, only
+    the owner can delete, move or share (see permissions.HasTaskAccess).
+    Archived tasks can be retrieved by id; any change to one restores it into Task first.
     """
     serializer_class = TaskSerializer
-    permission_classes = [IsOwnerOrReadOnly]
+    permission_classes = [HasTaskAccess]
 
     def get_queryset(self):
         user = self.request.user
         if user is None or not user.is_authenticated:
             return Task.objects.none()
 
-        qs = Task.objects.filter(owner=user)
+        qs = self.get_base_queryset(user)
+        shared = self.request.GET.get('shared')
+        if shared is not None:
+            if str(shared).lower() in ('1', 'true', 'yes'):
+                qs = qs.exclude(access_role=TaskAccess.OWNER)
+            else:
+                qs = qs.filter(access_role=TaskAccess.OWNER)
+        order_field = self.get_ordering_field()
+        if order_field.lstrip('-') == 'title':
+            # case- and accent-insensitive on every backend, the same key list() merges on
+            order_field = order_field.replace('title', 'title_normalized')
+        return self.filter_tasks(qs).order_by(order_field)
+
+    def get_base_queryset(self, user):
+        # own and shared tasks in one join on TaskAccess; only touches the user's shard
+        return Task.objects.visible_to(user).select_related('owner').prefetch_related('tags')
+
+    LIST_FILTERS = ('q', 'search', 'status', 'favorite', 'due', 'shared', 'tag', 'parent', 'depth')
+
+    def get_tag_filter(self):
+        """Normalized tag names asked for with ?tag=a,b (or repeated ?tag=)."""
+        names = [name for value in self.request.GET.getlist('tag') for name in value.split(',')]
+        return list(clean_tag_names(names))
+
+    def match_all_tags(self):
+        return (self.request.GET.get('tag_match') or '').strip().lower() == 'all'
+
+    def get_depth_filter(self, default=None):
+        """Levels asked for with ?depth=; None for 'all'."""
+        value = (self.request.GET.get('depth') or '').strip().lower()
+        if value == 'all':
+            return None
+        try:
+            return max(int(value), 1)
+        except ValueError:
+            return default
 
+    def get_parent_task(self, value):
+        """The ?parent= task if the user can see it (path and depth only), looked up once per request."""
+        if not hasattr(self, '_parent_task'):
+            self._parent_task = value.isdigit() and (
+                Task.objects.visible_to(self.request.user).only('pk', 'path', 'depth').filter(pk=value).first()
+            )
+        return self._parent_task
+
+    def filter_tasks(self, qs):
+        """
+        Apply ?q, ?status, ?favorite, ?due, ?tag, ?parent and ?depth; works for Task and
+        TaskArchive querysets (archived tasks are tag-filtered in list()).
+        """
         # text search (title)
         q = self.request.GET.get('q') or self.request.GET.get('search')
         if q:
@@ -56,6 +161,43 @@ class TaskViewSet(viewsets.ModelViewSet):
             else:
                 qs = qs.filter(is_favorite=False)
 
+        # due date filter (owner, due_at index), days are in the site's time zone
+        due = (self.request.GET.get('due') or '').strip().lower()
+        if due:
+            now = timezone.now()
+            today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+            if due == 'overdue':
+                qs = qs.filter(due_at__lt=now).exclude(status='done')
+            elif due == 'today':
+                qs = qs.filter(due_at__gte=today, due_at__lt=today + timedelta(days=1))
+            elif due == 'week':
+                qs = qs.filter(due_at__gte=today, due_at__lt=today + timedelta(days=7))
+
+        # tag filter, correlated lookups on the (task, tag) index of each candidate task
+        tags = self.get_tag_filter()
+        if tags and qs.model is Task:
+            links = TaskTag.objects.filter(task=OuterRef('pk'), tag__normalized__in=tags)
+            if self.match_all_tags() and len(tags) > 1:
+                matches = links.values('task').annotate(n=Count('pk')).values('n')
+                qs = qs.annotate(tag_matches=Subquery(matches)).filter(tag_matches=len(tags))
+            else:
+                qs = qs.filter(Exists(links))
+
+        # subtasks, a prefix scan on the materialized path whatever the depth
+        parent = (self.request.GET.get('parent') or '').strip().lower()
+        if parent in ('none', 'root'):
+            qs = qs.filter(parent_id__isnull=True)
+        elif parent:
+            parent_task = self.get_parent_task(parent)
+            qs = descendants(qs, parent_task, self.get_depth_filter(default=1)) if parent_task else qs.none()
+        else:
+            depth = self.get_depth_filter()
+            if depth:
+                qs = qs.filter(depth__lt=depth)
+
+        return qs
+
+    def get_ordering_field(self):
         # ordering: map friendly aliases to fields, but allow direct safe fields too
         ordering = (self.request.GET.get('ordering') or '').strip()
         if ordering:
@@ -64,37 +206,284 @@ class TaskViewSet(viewsets.ModelViewSet):
                 'oldest': 'created_at',
                 'title_asc': 'title',
                 'title_desc': '-title',
+                'manual': 'position',
                 # keep keys for backward compatibility:
                 'created_at': 'created_at',
                 '-created_at': '-created_at',
                 'title': 'title',
                 '-title': '-title',
+                'position': 'position',
             }
             order_field = mapping.get(ordering, None)
             # If not in mapping, only allow safe direct fields (prevent SQL injection)
             if order_field is None:
-                if ordering in ('created_at', '-created_at', 'title', '-title'):
+                if ordering in ('created_at', '-created_at', 'title', '-title', 'position'):
                     order_field = ordering
             if order_field:
-                qs = qs.order_by(order_field)
+                return order_field
+        # default ordering (most recent first)
+        return '-created_at'
+
+    def include_archived(self):
+        if str(self.request.GET.get('include_archived', '')).lower() not in ('1', 'true', 'yes'):
+            return False
+        # the archive only holds the caller's own tasks
+        if str(self.request.GET.get('shared', '')).lower() in ('1', 'true', 'yes'):
+            return False
+        # archived tasks are all done, skip the query when the status filter rules them out
+        status_param = (self.request.GET.get('status') or '').strip().lower()
+        return status_param not in ('todo', 'inprogress', 'pending')
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        tasks = list(self.get_queryset())
+        archived = list(
+            self.filter_tasks(TaskArchive.objects.for_owner(request.user)).order_by(self.get_ordering_field())
+        )
+        tags = set(self.get_tag_filter())
+        if tags:
+            # archived tasks keep their tag names in a JSON list
+            match = set.issuperset if self.match_all_tags() else lambda have, want: bool(have & want)
+            archived = [a for a in archived if match(set(clean_tag_names(a.tags)), tags)]
+        # merge on the key get_queryset() sorts tasks by (titles normalized, not raw)
+        order_field = self.get_ordering_field()
+        field = order_field.lstrip('-')
+        items = sorted(
+            tasks + archived,
+            key=(lambda item: normalize_title(item.title)) if field == 'title' else attrgetter(field),
+            reverse=order_field.startswith('-'),
+        )
+        return Response(self.get_serializer(items, many=True).data)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            archived = get_object_or_404(TaskArchive.objects.for_owner(self.request.user), pk=self.kwargs.get('pk'))
+        self.check_object_permissions(self.request, archived)
+        # reads are served from the archive, writes restore the task first
+        if self.request.method in SAFE_METHODS:
+            return archived
+        return archived.restore()
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        return Response(task_counts(request.user))
+
+    @action(detail=False, methods=['get'])
+    def tags(self, request):
+        """Tag facet counts. Unfiltered, these are the counters of the user's own tags."""
+        if not any(param in request.GET for param in self.LIST_FILTERS):
+            rows = (
+                Tag.objects.for_owner(request.user).filter(task_count__gt=0)
+                .order_by('-task_count', 'name').values('name', count=F('task_count'))
+            )
         else:
-            # default ordering (most recent first)
-            qs = qs.order_by('-created_at')
+            # one grouped query over the filtered tasks; shared tasks bring their owner's tags
+            rows = (
+                self.get_queryset().order_by().filter(tags__isnull=False)
+                .values('tags__normalized')
+                .annotate(name=Min('tags__name'), count=Count('pk'))
+                .order_by('-count', 'tags__normalized')
+            )
+        return Response(TagSerializer(rows, many=True).data)
 
-        return qs
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """
+        The task and its subtasks as a tree: one query for all levels (plus the tags
+        prefetch), nested here rather than serialized level by level.
+        """
+        task = self.get_object()
+        root = {**self.get_serializer(task).data, 'subtasks': []}
+        if not isinstance(task, Task):
+            return Response(root)
+        # parents come before their subtasks, siblings in manual order
+        items = descendants(
+            self.get_base_queryset(request.user), task, self.get_depth_filter(),
+        ).order_by('depth', 'position')
+        nodes = {task.pk: root}
+        for data in self.get_serializer(items, many=True).data:
+            node = nodes.get(data['parent'])
+            # a subtask under one the user cannot see is left out with it
+            if node is not None:
+                node['subtasks'].append({**data, 'subtasks': []})
+                nodes[data['id']] = node['subtasks'][-1]
+        return Response(root)
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        try:
+            limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+        except ValueError:
+            limit = 8
+        rows = suggest_titles(request.user, request.GET.get('prefix', ''), limit)
+        return Response([{'id': pk, 'title': title} for pk, title in rows])
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        task = self.get_object()
+        tasks = Task.objects.for_owner(request.user)
+        with transaction.atomic(using=tasks.db):
+            # positions are read and written under the owner lock, see ordering.py
+            lock_owner(request.user.pk, tasks.db)
+            neighbours = {}
+            for key in ('after', 'before'):
+                value = request.data.get(key)
+                if value in (None, ''):
+                    continue
+                neighbour = get_object_or_404(tasks.only('pk', 'position'), pk=value)
+                if neighbour.pk == task.pk:
+                    return Response({key: 'A task cannot be its own neighbour.'}, status=status.HTTP_400_BAD_REQUEST)
+                neighbours[key] = neighbour
+            if not neighbours:
+                return Response({'detail': 'Give "after" and/or "before".'}, status=status.HTTP_400_BAD_REQUEST)
+
+            others = tasks.exclude(pk=task.pk).order_by('position')
+            after, before = neighbours.get('after'), neighbours.get('before')
+            # with only one neighbour given, the other one is its actual neighbour (index range scan)
+            if after is not None and before is None:
+                before = others.filter(position__gt=after.position).only('pk', 'position').first()
+            elif before is not None and after is None:
+                after = others.filter(position__lt=before.position).order_by('-position').only('pk', 'position').first()
+            lower = after.position if after else None
+            upper = before.position if before else None
+            if lower is not None and upper is not None and lower >= upper:
+                return Response({'detail': '"after" must come before "before".'}, status=status.HTTP_400_BAD_REQUEST)
+
+            position = position_between(lower, upper)
+            if position is None:
+                # float precision used up between these two: renumber now and retry
+                rebalance_positions(Task, request.user.pk, tasks.db)
+                after = after and tasks.get(pk=after.pk)
+                before = before and tasks.get(pk=before.pk)
+                lower, upper = (after.position if after else None), (before.position if before else None)
+                position = position_between(lower, upper)
+            tasks.filter(pk=task.pk).update(position=position)
+            if needs_rebalance(lower, upper):
+                # renumber while there is still room, the moved task included
+                rebalance_positions(Task, request.user.pk, tasks.db)
+                position = tasks.values_list('position', flat=True).get(pk=task.pk)
+
+        activity_log.record('moved', request.user, task, position=[task.position, position])
+        return Response({'id': task.pk, 'position': position}, status=status.HTTP_200_OK)
+
+    def get_share_target(self, request):
+        """(user, role) from the request, or an error Response."""
+        value = str(request.data.get('user') or request.GET.get('user') or '').strip()
+        if not value:
+            return None, Response({'user': 'Give an email or username.'}, status=status.HTTP_400_BAD_REQUEST)
+        user = get_user_model().objects.filter(Q(email__iexact=value) | Q(username=value)).first()
+        if user is None:
+            return None, Response({'user': 'No such user.'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method != 'POST':
+            return (user, None), None
+        role = request.data.get('role', TaskAccess.VIEWER)
+        if role not in (TaskAccess.VIEWER, TaskAccess.EDITOR):
+            return None, Response({'role': 'Use "viewer" or "editor".'}, status=status.HTTP_400_BAD_REQUEST)
+        return (user, role), None
+
+    @action(detail=True, methods=['get', 'post', 'delete'])
+    def access(self, request, pk=None):
+        task = self.get_object()
+        if request.method == 'GET':
+            rows = TaskAccess.objects.using(task._state.db).filter(task_id=task.pk).select_related('user')
+            return Response(TaskAccessSerializer(rows.order_by('pk'), many=True).data)
+
+        target, error = self.get_share_target(request)
+        if error:
+            return error
+        user, role = target
+        if request.method == 'DELETE':
+            if unshare_task(task, user):
+                activity_log.record('unshared', request.user, task, user=user.pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            access = share_task(task, user, role)
+        except SharingError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        activity_log.record('shared', request.user, task, user=user.pk, role=role)
+        return Response(TaskAccessSerializer(access).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get', 'post', 'delete'])
+    def shares(self, request):
+        owner = request.user
+        if request.method == 'GET':
+            rows = ListShare.objects.for_owner(owner).select_related('user').order_by('pk')
+            return Response(ListShareSerializer(rows, many=True).data)
+
+        target, error = self.get_share_target(request)
+        if error:
+            return error
+        user, role = target
+        if request.method == 'DELETE':
+            unshare_list(owner, user)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            share = share_list(owner, user, role)
+        except SharingError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ListShareSerializer(share).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def activity(self, request, pk=None):
+        task = self.get_object()
+        # (task_id, -id) index, the log lives in 'default' whatever the task's shard
+        entries = Activity.objects.using('default').filter(task_id=task.pk).select_related('actor')
+        paginator = ActivityCursorPagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        return paginator.get_paginated_response(ActivitySerializer(page, many=True).data)
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        parent = getattr(serializer, 'parent_task', None)
+        # a subtask belongs to the owner of its tree, also when a collaborator adds it
+        task = serializer.save(owner=parent.owner if parent else self.request.user)
+        activity_log.record('created', self.request.user, task, title=task.title)
+
+    def perform_update(self, serializer):
+        data = serializer.validated_data
+        before = {field: getattr(serializer.instance, field) for field in data if field != 'tags'}
+        old_tags = [tag.name for tag in serializer.instance.tags.all()] if 'tags' in data else None
+        task = serializer.save()
+        changes = activity_log.diff(before, task)
+        if old_tags is not None:
+            new_tags = [tag.name for tag in task.tags.all()]
+            if sorted(old_tags) != sorted(new_tags):
+                changes['tags'] = [old_tags, new_tags]
+        if changes:
+            verb = 'status_changed' if 'status' in changes else 'updated'
+            activity_log.record(verb, self.request.user, task, **changes)
+
+    def perform_destroy(self, instance):
+        # subtasks go with their parent
+        deleted = delete_subtree(instance)
+        extra = {'subtasks': len(deleted) - 1} if len(deleted) > 1 else {}
+        activity_log.record('deleted', self.request.user, instance.pk, title=instance.title, **extra)
 
     @action(detail=True, methods=['post'], url_path='toggle-favorite')
     def toggle_favorite(self, request, pk=None):
         task = self.get_object()
         task.is_favorite = not task.is_favorite
         task.save()
+        activity_log.record('favorited' if task.is_favorite else 'unfavorited', request.user, task)
         return Response({'id': task.id, 'is_favorite': task.is_favorite}, status=status.HTTP_200_OK)
 
 
 # server-rendered tasks home page view (root)
 @login_required
 def tasks_index(request):
-    return render(request, 'tasks_index.html')
+    # embed the first tasks (same queryset + serializer as the API) so main.js can
+    # paint them without waiting for a second round trip to /api/tasks/
+    view = TaskViewSet(request=request, action='list', format_kwarg=None)
+    page_size = settings.TASKS_INITIAL_PAGE_SIZE
+    tasks = view.get_queryset()[:page_size]
+    counts = task_counts(request.user)
+    initial_tasks = {
+        'results': view.get_serializer(tasks, many=True).data,
+        'counts': counts,
+        # main.js keys its IndexedDB copy by user
+        'user': request.user.pk,
+    }
+    return render(request, 'tasks_index.html', {'initial_tasks': initial_tasks, 'counts': counts})